@@ -0,0 +1,60 @@
+import queue
+import threading
+import time
+
+from knights_and_liars import kl_gurobi, kl_mip
+
+
+def kl_anytime(G, solver="gurobi", TimeLimit=None, NodeLimit=None, gap=0, **kwargs):
+    # Yields a dict with the keys value, red_vertices, bound, gap and time (since the call)
+    # for every improving coloring, and finally one for the result with the additional key
+    # status. Its bound and gap are those of the last improvement, which remain valid, or
+    # None if unknown. The limits are translated to the parameters of kl_gurobi or kl_mip,
+    # and the other keyword arguments are passed on. The solver runs in a thread; if the
+    # generator is closed early, it is stopped at the next improving coloring, except for CBC,
+    # which runs on to its limits.
+    if solver not in ["gurobi", "mip"]:
+        raise ValueError('The options for solver are "gurobi" or "mip"')
+    if solver == "gurobi":
+        solve = kl_gurobi
+        kwargs.update(TimeLimit=TimeLimit, NodeLimit=NodeLimit, MIPGap=gap)
+    else:
+        solve = kl_mip
+        kwargs.update(max_seconds=TimeLimit, max_nodes=NodeLimit, max_gap=gap)
+
+    started = time.time()
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def report(incumbent):
+        items.put(incumbent)
+        return stop.is_set()
+
+    def run():
+        try:
+            items.put(solve(G, callback=report, **kwargs))
+        except Exception as e:
+            items.put(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    last = None
+    try:
+        while True:
+            item = items.get()
+            if isinstance(item, Exception):
+                raise item
+            if isinstance(item, dict):
+                last = item
+                yield item
+                continue
+            value, red_vertices, status = item
+            result = {"value": value, "red_vertices": red_vertices, "bound": None, "gap": None}
+            if status == "optimal":
+                result.update(bound=value, gap=0.0)
+            elif last is not None and last["value"] == value:
+                result.update(bound=last["bound"], gap=last["gap"])
+            result.update(time=time.time() - started, status=status)
+            yield result
+            return
+    finally:
+        stop.set()
@@ -0,0 +1,106 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from session import SolverSession
+
+
+def backbone(
+    G,
+    solver="gurobi",
+    formulation="standard",
+    workers=1,
+    automorphisms=None,
+    presolve=True,
+    TimeLimit=None,
+    **params,
+):
+    # The vertices that are red in every optimal coloring of G and those that are blue in
+    # every optimal coloring. G is solved once, and the optimum becomes a cutoff, so that
+    # each probe, a vertex fixed to the opposite of its color in all optimal colorings
+    # found so far, only asks for one coloring of that value. Every coloring a probe finds
+    # settles all vertices on which it disagrees with the known optima, and so do its images
+    # under the automorphisms, for example those of symmetry.grid_automorphisms. The probes
+    # run in a session per worker process, in the calling process for workers=1, and
+    # TimeLimit is per probe. The keyword arguments are passed to SolverSession.
+    # Returns (value, red_backbone, blue_backbone, undecided), with the vertices whose
+    # probe hit the time limit in undecided, or None if G was not solved to optimality.
+    session = SolverSession(G, solver, formulation, presolve=presolve, max_colorings=100, **params)
+    value, red_vertices, status = session.solve(TimeLimit=TimeLimit)
+    if status != "optimal":
+        return None
+    session.set_cutoff(value)
+
+    # Vertices red and blue in every optimal coloring found so far.
+    red = set(red_vertices)
+    blue = set(G.nodes()) - red
+    undecided = set()
+
+    def settle(coloring):
+        for image in [coloring] + [{sigma[x] for x in coloring} for sigma in automorphisms or []]:
+            red.intersection_update(image)
+            blue.difference_update(image)
+
+    def probe(x, result):
+        if result is not None and result[2] == "infeasible":
+            return
+        if result is None or result[1] is None:
+            undecided.add(x)
+        else:
+            settle(set(result[1]))
+
+    vertices = iter(G.nodes())
+
+    def next_vertex():
+        return next((x for x in vertices if x in red or x in blue), None)
+
+    settle(set(red_vertices))
+    if workers == 1:
+        x = next_vertex()
+        while x is not None:
+            probe(x, _probe(session, x, x in red, TimeLimit))
+            x = next_vertex()
+    else:
+        # The main process hands out one vertex per idle worker, so that vertices settled by
+        # the colorings of running probes are not probed anymore.
+        with ProcessPoolExecutor(
+            workers,
+            initializer=_init_worker,
+            initargs=(G, solver, formulation, presolve, value, params),
+        ) as pool:
+            running = {}
+            while True:
+                while len(running) < workers:
+                    x = next_vertex()
+                    if x is None:
+                        break
+                    running[pool.submit(_worker_probe, x, x in red, TimeLimit)] = x
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    probe(running.pop(future), future.result())
+
+    red -= undecided
+    blue -= undecided
+    return value, sorted(red, key=str), sorted(blue, key=str), sorted(undecided, key=str)
+
+
+def _probe(session, x, red, TimeLimit):
+    # Whether x can take the opposite color in a coloring with the optimal value.
+    if red:
+        return session.solve(blue_vertices=[x], TimeLimit=TimeLimit)
+    return session.solve(red_vertices=[x], TimeLimit=TimeLimit)
+
+
+_session = None
+
+
+def _init_worker(G, solver, formulation, presolve, value, params):
+    global _session
+    _session = SolverSession(
+        G, solver, formulation, presolve=presolve, max_colorings=100, **params
+    )
+    _session.set_cutoff(value)
+
+
+def _worker_probe(x, red, TimeLimit):
+    return _probe(_session, x, red, TimeLimit)
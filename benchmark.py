@@ -0,0 +1,247 @@
+import networkx as nx
+import argparse
+import json
+import platform
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from knights_and_liars import kl_gurobi, kl_mip
+from stats import SolveStats
+from utility import triangle_graph
+
+# The sizes of the families are a side length, [m, n] for rectangles and tori, [d, n, seed]
+# for random d-regular graphs on n vertices and the dimension for hypercubes.
+FAMILIES = {
+    "grid": lambda n: nx.grid_2d_graph(n, n),
+    "rectangle": lambda size: nx.grid_2d_graph(*size),
+    "torus": lambda size: nx.grid_2d_graph(*size, periodic=True),
+    "triangle": triangle_graph,
+    "regular": lambda size: nx.random_regular_graph(*size),
+    "hypercube": nx.hypercube_graph,
+}
+
+DEFAULT_CONFIG = {
+    "instances": [
+        ["grid", 6],
+        ["grid", 8],
+        ["rectangle", [4, 12]],
+        ["torus", [6, 6]],
+        ["triangle", 8],
+        ["regular", [4, 40, 0]],
+        ["hypercube", 4],
+    ],
+    "formulations": ["standard", "bosch", "bosch_subsets", "alternative", "indicator"],
+    "backends": ["gurobi", "mip"],
+    "repeats": 3,
+    "threads": 1,
+    "time_limit": 60,
+}
+
+
+def run_benchmark(
+    instances,
+    formulations,
+    backends,
+    repeats=3,
+    threads=1,
+    time_limit=None,
+    **solver_options,
+):
+    # Runs every combination of instance, formulation and backend repeats times, one run
+    # at a time, each in a fresh process so that the peak RSS belongs to that run alone.
+    # The formulation "indicator" exists only for Gurobi and is skipped for python-mip.
+    # Returns one record per run, see _run.
+    jobs = [
+        (family, size, formulation, backend, repeat, threads, time_limit, solver_options)
+        for family, size in instances
+        for formulation in formulations
+        for backend in backends
+        if not (backend == "mip" and formulation == "indicator")
+        for repeat in range(repeats)
+    ]
+    with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+        return list(pool.map(_run, *zip(*jobs)))
+
+
+def _run(family, size, formulation, backend, repeat, threads, time_limit, solver_options):
+    # A failing run, for example a model too large for the solver license, is recorded
+    # with its error instead of ending the whole benchmark.
+    G = FAMILIES[family](size)
+    stats = SolveStats(f"{family} {size} {formulation} {backend}")
+    error = None
+    try:
+        if backend == "gurobi":
+            kl_gurobi(
+                G,
+                formulation=formulation,
+                OutputFlag=0,
+                Threads=threads,
+                TimeLimit=time_limit,
+                stats=stats,
+                **solver_options,
+            )
+        else:
+            kl_mip(
+                G,
+                formulation=formulation,
+                verbose=0,
+                threads=threads,
+                max_seconds=time_limit,
+                stats=stats,
+                **solver_options,
+            )
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    record = {
+        "family": family,
+        "size": size,
+        "vertices": G.number_of_nodes(),
+        "edges": G.number_of_edges(),
+        "formulation": formulation,
+        "backend": backend,
+        "repeat": repeat,
+    }
+    # The requested formulation is kept as the key of the run, and the one the solver
+    # reports is stored separately.
+    solved = stats.to_dict()
+    solved["solved_formulation"] = solved.pop("formulation")
+    del solved["label"], solved["started"], solved["solver"]
+    record.update(solved)
+    record["error"] = error
+    if error is not None:
+        record["status"] = "error"
+    return record
+
+
+def check_agreement(records):
+    # The optimal values of every instance must agree across formulations and backends.
+    # Returns the instances where they do not, with the values per formulation and backend.
+    values = {}
+    for r in records:
+        if r["status"] == "optimal":
+            key = (r["family"], json.dumps(r["size"]))
+            values.setdefault(key, {})[(r["formulation"], r["backend"])] = r["value"]
+    return {key: found for key, found in values.items() if len(set(found.values())) > 1}
+
+
+def summarize(records):
+    # Medians over the repeats of each instance, formulation and backend.
+    groups = {}
+    for r in records:
+        key = (r["family"], json.dumps(r["size"]), r["formulation"], r["backend"])
+        groups.setdefault(key, []).append(r)
+    summary = {}
+    for key, runs in groups.items():
+        summary[key] = {
+            "value": runs[0]["value"],
+            "status": runs[0]["status"],
+            "rows": runs[0]["rows"],
+            "nonzeros": runs[0]["nonzeros"],
+        }
+        for metric in ["build_time", "solve_time", "peak_rss"]:
+            measured = [r[metric] for r in runs if r[metric] is not None]
+            summary[key][metric] = statistics.median(measured) if measured else None
+    return summary
+
+
+def compare(records, baseline, tolerance=0.25, min_seconds=0.05):
+    # Compares the medians of the records with those of a baseline run. A time counts as a
+    # regression if it grew by more than the tolerance and by at least min_seconds, which
+    # keeps the noise of very short runs out, and the peak RSS if it grew by more than the
+    # tolerance. A changed optimal value is always reported. Returns one row per
+    # difference found.
+    current, previous = summarize(records), summarize(baseline)
+    rows = []
+    for key, now in current.items():
+        if key not in previous:
+            continue
+        before = previous[key]
+        if now["status"] == before["status"] == "optimal" and now["value"] != before["value"]:
+            rows.append((key, "value", before["value"], now["value"], None))
+        for metric in ["build_time", "solve_time", "peak_rss"]:
+            old, new = before[metric], now[metric]
+            if old is None or new is None or old <= 0:
+                continue
+            if new > (1 + tolerance) * old and (metric == "peak_rss" or new - old >= min_seconds):
+                rows.append((key, metric, old, new, new / old))
+    return rows
+
+
+def format_report(records, baseline=None, tolerance=0.25):
+    lines = [
+        f"{'family':<10} {'size':<12} {'formulation':<14} {'backend':<7} {'value':>6} "
+        f"{'status':<10} {'rows':>8} {'build':>8} {'solve':>9} {'rss MB':>8}"
+    ]
+    for (family, size, formulation, backend), s in sorted(summarize(records).items()):
+        rss = None if s["peak_rss"] is None else s["peak_rss"] / 2**20
+        lines.append(
+            f"{family:<10} {size:<12} {formulation:<14} {backend:<7} {_cell(s['value']):>6} "
+            f"{_cell(s['status']):<10} {_cell(s['rows']):>8} {_cell(s['build_time'], '.3f'):>8} "
+            f"{_cell(s['solve_time'], '.3f'):>9} {_cell(rss, '.0f'):>8}"
+        )
+
+    for (family, size), found in check_agreement(records).items():
+        lines.append(f"DISAGREEMENT {family} {size}: {found}")
+
+    if baseline is not None:
+        regressions = compare(records, baseline, tolerance)
+        lines.append(f"{len(regressions)} regressions against the baseline")
+        for (family, size, formulation, backend), metric, old, new, ratio in regressions:
+            change = "" if ratio is None else f" ({ratio:.2f}x)"
+            lines.append(
+                f"REGRESSION {family} {size} {formulation} {backend} {metric}: "
+                f"{old} -> {new}{change}"
+            )
+    return "\n".join(lines)
+
+
+def _cell(value, spec=""):
+    # Runs that never reached the solver have no statistics.
+    return "-" if value is None else format(value, spec)
+
+
+def environment():
+    # Recorded with the results, since timings are only comparable on the same setup.
+    versions = {"python": sys.version.split()[0], "platform": platform.platform()}
+    try:
+        import gurobipy as gp
+
+        versions["gurobi"] = ".".join(map(str, gp.gurobi.version()))
+    except ImportError:
+        pass
+    try:
+        import mip
+
+        versions["mip"] = mip.__version__
+    except ImportError:
+        pass
+    return versions
+
+
+def write_results(path, records, config):
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "config": config, "records": records}, f)
+
+
+def read_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config", nargs="?", help="JSON file with keys as in DEFAULT_CONFIG")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    config = dict(DEFAULT_CONFIG)
+    if args.config is not None:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    records = run_benchmark(**config)
+    write_results(args.output, records, config)
+    baseline = read_results(args.baseline)["records"] if args.baseline else None
+    print(format_report(records, baseline, args.tolerance))
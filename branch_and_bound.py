@@ -0,0 +1,179 @@
+import networkx as nx
+import numpy as np
+import time
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+from csr_graph import CSRGraph, adjacency_matrix
+from utility import repair_coloring
+
+
+def kl_branch_and_bound(G, red_vertices=None, blue_vertices=None, TimeLimit=None, start=None):
+    # Depth-first branch and bound without an external solver. For every vertex, the numbers
+    # of red and blue neighbors are kept in numpy arrays and updated whenever a vertex is
+    # colored, and the rules in _Search.implications color further vertices or detect a
+    # conflict. Vertices are branched on in reverse Cuthill-McKee order, red first, so that
+    # the colored vertices stay close together and the rules apply early.
+    if hasattr(G, "to_csr"):
+        G = G.to_csr()
+    nodes = list(G.nodes())
+    index = {x: i for i, x in enumerate(nodes)}
+    red_vertices = set(red_vertices or [])
+    blue_vertices = set(blue_vertices or [])
+    if any(x not in index for x in red_vertices):
+        return None, None, "infeasible"
+    if not nodes:
+        return 0, [], "optimal"
+
+    search = _Search(G, nodes)
+    fixed = [(i, 0) for i in np.flatnonzero(search.deg % 2 == 1).tolist()]
+    fixed += [(index[x], 1) for x in red_vertices]
+    fixed += [(index[x], 0) for x in blue_vertices if x in index]
+    if not all(search.assign(i, c) for i, c in fixed):
+        return None, None, "infeasible"
+
+    # Any valid coloring that respects the fixed vertices is a first incumbent.
+    best_value, best_red = -1, None
+    for candidate in [start, nodes]:
+        if candidate is None:
+            continue
+        red = repair_coloring(G, candidate)
+        if red_vertices <= red and not red & blue_vertices and len(red) > best_value:
+            best_value, best_red = len(red), list(red)
+
+    deadline = None if TimeLimit is None else time.time() + TimeLimit
+    if isinstance(G, CSRGraph):
+        order = reverse_cuthill_mckee(G.to_scipy(), symmetric_mode=True).astype(np.int64)
+    else:
+        order = [index[x] for x in nx.utils.reverse_cuthill_mckee_ordering(G)]
+        order = np.array(order, dtype=np.int64)
+    stack = []
+    consistent = True
+    while True:
+        if consistent:
+            search.nodes += 1
+            if deadline is not None and search.nodes % 100 == 0 and time.time() > deadline:
+                if best_red is None:
+                    return None, None, "timelimit"
+                return best_value, best_red, "timelimit"
+            undecided = order[search.color[order] < 0]
+            if search.upper_bound() <= best_value:
+                pass
+            elif len(undecided) == 0:
+                best_value = int((search.color == 1).sum())
+                best_red = [nodes[i] for i in np.flatnonzero(search.color == 1).tolist()]
+            else:
+                v = int(undecided[0])
+                stack.append((len(search.trail), v, [0]))
+                consistent = search.assign(v, 1)
+                continue
+
+        # Backtrack to the deepest vertex with a color left to try.
+        while stack:
+            mark, v, colors = stack[-1]
+            search.undo(mark)
+            if colors:
+                consistent = search.assign(v, colors.pop())
+                break
+            stack.pop()
+        else:
+            break
+
+    if best_red is None:
+        return None, None, "infeasible"
+    return best_value, best_red, "optimal"
+
+
+class _Search:
+    def __init__(self, G, nodes):
+        _, adjacency = adjacency_matrix(G)
+        self.neighbors = np.split(adjacency.indices.astype(np.int64), adjacency.indptr[1:-1])
+        self.deg = np.diff(adjacency.indptr)
+        self.half = self.deg // 2
+        self.color = np.full(len(nodes), -1, dtype=np.int8)
+        self.red_count = np.zeros(len(nodes), dtype=np.int64)
+        self.blue_count = np.zeros(len(nodes), dtype=np.int64)
+        self.trail = []
+        self.nodes = 0
+
+    def assign(self, v, c):
+        # Colors v with c and propagates, returns False on a conflict. The colored vertices
+        # are recorded in the trail, also on a conflict, so undo restores the counters.
+        queue = [(v, c)]
+        while queue:
+            v, c = queue.pop()
+            if self.color[v] >= 0:
+                if self.color[v] != c:
+                    return False
+                continue
+            self.color[v] = c
+            self.trail.append(v)
+            neighbors = self.neighbors[v]
+            if c:
+                self.red_count[neighbors] += 1
+            else:
+                self.blue_count[neighbors] += 1
+            for x in [v] + neighbors.tolist():
+                implied = self.implications(x)
+                if implied is None:
+                    return False
+                queue.extend(implied)
+        return True
+
+    def implications(self, x):
+        # Generalizes tvb_step: with r red and u undecided neighbors out of deg = 2h, a red
+        # vertex needs r <= h <= r + u, and forces its undecided neighbors blue once r = h
+        # and red once r + u = h. A blue vertex needs r != h, so its last undecided neighbor
+        # is forced. An undecided vertex with r > h or r + u < h can only be blue. Returns
+        # None on a conflict.
+        color = self.color[x]
+        deg = self.deg[x]
+        if deg % 2 == 1:
+            return []
+        r = self.red_count[x]
+        u = deg - r - self.blue_count[x]
+        h = self.half[x]
+        if color == 1:
+            if r > h or r + u < h:
+                return None
+            if u > 0 and (r == h or r + u == h):
+                return [(y, int(r < h)) for y in self._undecided(x)]
+        elif color == 0:
+            if u == 0 and r == h:
+                return None
+            if u == 1 and (r == h or r == h - 1):
+                return [(y, int(r == h)) for y in self._undecided(x)]
+        elif r > h or r + u < h:
+            return [(x, 0)]
+        elif u == 0:
+            return [(x, 1)]
+        return []
+
+    def _undecided(self, x):
+        neighbors = self.neighbors[x]
+        return neighbors[self.color[neighbors] < 0].tolist()
+
+    def upper_bound(self):
+        # Every red vertex x has exactly half(x) blue neighbors, and a blue vertex y has at
+        # most cap(y) red neighbors, its red and undecided ones, and fewer if that is exactly
+        # half(y). Counting the red-blue edges
+        # from both sides gives sum(half(x) for red x) <= sum(cap(y) for blue y), and each
+        # undecided vertex that becomes red moves half + cap from the slack of this
+        # inequality, so the cheapest ones give a bound.
+        red = self.color == 1
+        undecided = self.color < 0
+        cap = self.deg - self.blue_count
+        cap[(self.color == 0) & (cap == self.half) & (self.deg % 2 == 0)] -= 1
+        slack = cap[~red].sum() - self.half[red].sum()
+        if slack < 0:
+            return -1
+        costs = np.sort(self.half[undecided] + cap[undecided])
+        return int(red.sum()) + int(np.searchsorted(np.cumsum(costs), slack, side="right"))
+
+    def undo(self, mark):
+        while len(self.trail) > mark:
+            v = self.trail.pop()
+            if self.color[v]:
+                self.red_count[self.neighbors[v]] -= 1
+            else:
+                self.blue_count[self.neighbors[v]] -= 1
+            self.color[v] = -1
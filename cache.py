@@ -0,0 +1,160 @@
+import networkx as nx
+from networkx.algorithms.isomorphism import GraphMatcher
+import json
+import os
+from pathlib import Path
+
+from branch_and_bound import kl_branch_and_bound
+from knights_and_liars import kl_gurobi, kl_mip
+
+
+class ResultCache:
+    # Each file holds the entries of one Weisfeiler-Lehman hash, for all formulations and
+    # solvers and for non-isomorphic graphs whose hashes collide, and at most max_files of
+    # them are kept.
+    def __init__(self, path="kl_cache", max_files=1000):
+        self.path = Path(path)
+        self.max_files = max_files
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def solve(
+        self,
+        G,
+        red_vertices=None,
+        blue_vertices=None,
+        formulation="standard",
+        solver="gurobi",
+        **kwargs,
+    ):
+        if solver not in ["gurobi", "mip", "native"]:
+            raise ValueError('The options for solver are "gurobi", "mip" or "native"')
+
+        # Red vertices that are not in G make the problem infeasible, but they have no place
+        # in the key, so such calls bypass the cache instead of overwriting the entry of the
+        # problem without them.
+        cached = all(x in G for x in red_vertices or [])
+        if cached:
+            result = self.get(G, red_vertices, blue_vertices, formulation, solver)
+            if result is not None:
+                return result
+
+        solve = {"gurobi": kl_gurobi, "mip": kl_mip, "native": kl_branch_and_bound}[solver]
+        if solver != "native":
+            kwargs["formulation"] = formulation
+        result = solve(G, red_vertices=red_vertices, blue_vertices=blue_vertices, **kwargs)
+        # Only definite answers are stored, results under a time limit depend on the run.
+        if cached and result is not None and result[2] in ["optimal", "infeasible"]:
+            self.put(G, result, red_vertices, blue_vertices, formulation, solver)
+        return result
+
+    def get(
+        self, G, red_vertices=None, blue_vertices=None, formulation="standard", solver="gurobi"
+    ):
+        nodes, H, key = _canonical_graph(G, red_vertices, blue_vertices)
+        file = self.path / f"{key}.json"
+        if not file.exists():
+            return None
+        for entry in _read(file):
+            if entry["formulation"] != formulation or entry["solver"] != solver:
+                continue
+            mapping = _isomorphism(_entry_graph(entry), H)
+            if mapping is None:
+                continue
+            os.utime(file)
+            if entry["red"] is None:
+                return entry["value"], None, entry["status"]
+            red = [nodes[mapping[i]] for i in entry["red"]]
+            return entry["value"], red, entry["status"]
+        return None
+
+    def put(
+        self,
+        G,
+        result,
+        red_vertices=None,
+        blue_vertices=None,
+        formulation="standard",
+        solver="gurobi",
+    ):
+        nodes, H, key = _canonical_graph(G, red_vertices, blue_vertices)
+        index = {x: i for i, x in enumerate(nodes)}
+        value, red, status = result
+        entry = {
+            "formulation": formulation,
+            "solver": solver,
+            "edges": [list(e) for e in H.edges()],
+            "fixed": [H.nodes[i]["fixed"] for i in range(len(nodes))],
+            "value": value,
+            "red": None if red is None else sorted(index[x] for x in red),
+            "status": status,
+        }
+
+        file = self.path / f"{key}.json"
+        entries = _read(file) if file.exists() else []
+        entries = [
+            e
+            for e in entries
+            if e["formulation"] != formulation
+            or e["solver"] != solver
+            or _isomorphism(_entry_graph(e), H) is None
+        ]
+        entries.append(entry)
+        tmp = file.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, file)
+        self._evict()
+
+    def _evict(self):
+        files = sorted(self.path.glob("*.json"), key=lambda file: file.stat().st_mtime)
+        for file in files[: max(0, len(files) - self.max_files)]:
+            file.unlink()
+
+
+def _canonical_graph(G, red_vertices, blue_vertices):
+    # Blue vertices that are not in G are ignored, as by the solvers, and red ones are
+    # rejected, since the key could not tell the problem apart from the one without them.
+    red_vertices = set(red_vertices or [])
+    blue_vertices = set(blue_vertices or [])
+    if any(x not in G for x in red_vertices):
+        raise ValueError("The fixed red vertices must be vertices of G")
+    nodes = list(G.nodes())
+    index = {x: i for i, x in enumerate(nodes)}
+    H = nx.Graph()
+    for i, x in enumerate(nodes):
+        if x in red_vertices:
+            fixed = "red"
+        elif x in blue_vertices:
+            fixed = "blue"
+        else:
+            fixed = "free"
+        H.add_node(i, fixed=fixed)
+    H.add_edges_from((index[x], index[y]) for x, y in G.edges())
+    key = nx.weisfeiler_lehman_graph_hash(H, node_attr="fixed")
+    return nodes, H, key
+
+
+def _entry_graph(entry):
+    H = nx.Graph()
+    for i, fixed in enumerate(entry["fixed"]):
+        H.add_node(i, fixed=fixed)
+    H.add_edges_from(entry["edges"])
+    return H
+
+
+def _isomorphism(H1, H2):
+    # The Weisfeiler-Lehman hash can collide for non-isomorphic graphs, so a hit is only
+    # accepted together with an explicit isomorphism, which also maps the coloring back.
+    if H1.number_of_nodes() != H2.number_of_nodes():
+        return None
+    if H1.number_of_edges() != H2.number_of_edges():
+        return None
+    matcher = GraphMatcher(H1, H2, node_match=lambda a, b: a["fixed"] == b["fixed"])
+    if matcher.is_isomorphic():
+        return matcher.mapping
+    return None
+
+
+def _read(file):
+    with open(file, encoding="utf-8") as f:
+        return json.load(f)
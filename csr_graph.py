@@ -0,0 +1,192 @@
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+
+class CSRGraph:
+    # An undirected simple graph in compressed sparse row form: the neighbors of the vertex
+    # with index i are indices[indptr[i]:indptr[i + 1]], in increasing order, and deg holds
+    # the degrees. The arrays are int32, and indptr is int64 only for 2**31 or more entries.
+    # The labels map indices back to vertices: None for the vertices 0, ..., n - 1, an
+    # integer array with one row per vertex for tuple vertices like (i, j) of grids, which
+    # costs a few bytes per vertex, or a list of arbitrary vertices.
+    #
+    # The methods used by the package on networkx graphs, nodes(), degree, neighbors(x),
+    # edges(), subgraph(nodes) and the number_of_* methods, work with labels, so a CSRGraph
+    # can be passed wherever a graph is expected. The list of labels and the dict from
+    # labels to indices are built on first use.
+    def __init__(self, indptr, indices, labels=None):
+        indices = np.asarray(indices, dtype=np.int32)
+        self.indptr = np.asarray(indptr, dtype=np.int32 if len(indices) < 2**31 else np.int64)
+        self.indices = indices
+        self.deg = np.diff(self.indptr).astype(np.int32)
+        if labels is not None and not isinstance(labels, np.ndarray):
+            labels = list(labels)
+        self.labels = labels
+        self._nodes = None
+        self._index = None
+
+    @classmethod
+    def from_edges(cls, n, u, v, labels=None):
+        # From two arrays of end points, as indices. Loops and repeated edges are dropped.
+        u = np.asarray(u, dtype=np.int64)
+        v = np.asarray(v, dtype=np.int64)
+        keep = u != v
+        rows = np.concatenate([u[keep], v[keep]])
+        cols = np.concatenate([v[keep], u[keep]])
+        A = sp.csr_array((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+        A.sum_duplicates()
+        A.sort_indices()
+        return cls(A.indptr, A.indices, labels)
+
+    @classmethod
+    def from_networkx(cls, G):
+        nodes = list(G.nodes())
+        A = nx.to_scipy_sparse_array(G, nodelist=nodes, weight=None, dtype=np.int8, format="csr")
+        A.sort_indices()
+        labels = nodes
+        if nodes == list(range(len(nodes))):
+            labels = None
+        elif nodes and all(isinstance(x, tuple) and len(x) == len(nodes[0]) for x in nodes):
+            if all(isinstance(c, (int, np.integer)) for x in nodes for c in x):
+                labels = np.array(nodes, dtype=np.int64)
+        return cls(A.indptr, A.indices, labels)
+
+    def to_networkx(self):
+        G = nx.Graph()
+        G.add_nodes_from(self.nodes())
+        G.add_edges_from(self.edges())
+        return G
+
+    def to_scipy(self, dtype=float):
+        # The adjacency matrix, with the rows and columns in the order of nodes().
+        data = np.ones(len(self.indices), dtype=dtype)
+        n = len(self.deg)
+        return sp.csr_array((data, self.indices, self.indptr), shape=(n, n))
+
+    def nodes(self):
+        if self._nodes is None:
+            if self.labels is None:
+                self._nodes = list(range(len(self.deg)))
+            elif isinstance(self.labels, np.ndarray):
+                self._nodes = [tuple(row) for row in self.labels.tolist()]
+            else:
+                self._nodes = self.labels
+        return self._nodes
+
+    def index(self, x):
+        if self.labels is None:
+            if isinstance(x, (int, np.integer)) and 0 <= x < len(self.deg):
+                return int(x)
+            raise KeyError(x)
+        if self._index is None:
+            self._index = {y: i for i, y in enumerate(self.nodes())}
+        return self._index[x]
+
+    def neighbor_indices(self, i):
+        return self.indices[self.indptr[i] : self.indptr[i + 1]]
+
+    def neighbor_lists(self):
+        # The neighbors of every vertex as lists of indices, as used by the search loops.
+        return np.split(self.indices, self.indptr[1:-1])
+
+    def neighbors(self, x):
+        nodes = self.nodes()
+        return iter([nodes[j] for j in self.neighbor_indices(self.index(x)).tolist()])
+
+    @property
+    def degree(self):
+        return _DegreeView(self)
+
+    def edges(self):
+        nodes = self.nodes()
+        rows = np.repeat(np.arange(len(self.deg)), self.deg)
+        upper = rows < self.indices
+        pairs = zip(rows[upper].tolist(), self.indices[upper].tolist())
+        return [(nodes[i], nodes[j]) for i, j in pairs]
+
+    def subgraph(self, nodes):
+        # The induced subgraph, with the vertices in the order of this graph.
+        keep = np.zeros(len(self.deg), dtype=bool)
+        keep[[self.index(x) for x in nodes]] = True
+        selected = np.flatnonzero(keep)
+        A = self.to_scipy(np.int8)[selected][:, selected]
+        A.sort_indices()
+        if self.labels is None:
+            labels = selected.tolist()
+        elif isinstance(self.labels, np.ndarray):
+            labels = self.labels[selected]
+        else:
+            labels = [self.labels[i] for i in selected.tolist()]
+        return CSRGraph(A.indptr, A.indices, labels)
+
+    def number_of_nodes(self):
+        return len(self.deg)
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def __len__(self):
+        return len(self.deg)
+
+    def __iter__(self):
+        return iter(self.nodes())
+
+    def __contains__(self, x):
+        try:
+            self.index(x)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __getstate__(self):
+        # The caches are rebuilt by worker processes on first use.
+        state = dict(vars(self))
+        state["_nodes"] = state["_index"] = None
+        return state
+
+
+class _DegreeView:
+    # G.degree[x], G.degree(x) and G.degree(), as for networkx graphs.
+    def __init__(self, G):
+        self._G = G
+
+    def __getitem__(self, x):
+        return int(self._G.deg[self._G.index(x)])
+
+    def __call__(self, x=None):
+        return iter(self) if x is None else self[x]
+
+    def __iter__(self):
+        return zip(self._G.nodes(), self._G.deg.tolist())
+
+
+def adjacency_matrix(G, dtype=float):
+    # The vertices of G and its adjacency matrix in their order, as a scipy CSR array.
+    # The lattices of lattice.py are materialized first.
+    if hasattr(G, "to_csr"):
+        G = G.to_csr()
+    if isinstance(G, CSRGraph):
+        return G.nodes(), G.to_scipy(dtype)
+    nodes = list(G.nodes())
+    if not nodes:
+        return nodes, sp.csr_array((0, 0), dtype=dtype)
+    return nodes, nx.to_scipy_sparse_array(
+        G, nodelist=nodes, weight=None, dtype=dtype, format="csr"
+    )
+
+
+def degree_array(G):
+    if isinstance(G, CSRGraph):
+        return G.deg.astype(np.int64)
+    if hasattr(G, "degree_array"):
+        return G.degree_array()
+    return np.array([d for _, d in G.degree()], dtype=np.int64)
+
+
+def as_networkx(G):
+    # For the algorithms that need networkx itself, like components, tree decompositions
+    # and isomorphisms, which are only run on graphs of moderate size.
+    if hasattr(G, "to_csr"):
+        G = G.to_csr()
+    return G.to_networkx() if isinstance(G, CSRGraph) else G
@@ -0,0 +1,162 @@
+import networkx as nx
+import itertools as it
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from branch_and_bound import kl_branch_and_bound
+from knights_and_liars import kl_gurobi, kl_mip
+from csr_graph import as_networkx
+from utility import trivially_blue_vertices
+
+
+class _Leaf:
+    # Stands in for a removed trivially blue neighbor, see _component_graph.
+    def __init__(self, vertex, index):
+        self.vertex = vertex
+        self.index = index
+
+    def __eq__(self, other):
+        if not isinstance(other, _Leaf):
+            return False
+        return (self.vertex, self.index) == (other.vertex, other.index)
+
+    def __hash__(self):
+        return hash((_Leaf, self.vertex, self.index))
+
+    def __repr__(self):
+        return f"_Leaf({self.vertex!r}, {self.index!r})"
+
+
+def kl_components(
+    G,
+    red_vertices=None,
+    blue_vertices=None,
+    solver="gurobi",
+    presolve=True,
+    processes=None,
+    small=12,
+    time_limit=None,
+    **kwargs,
+):
+    if solver not in ["gurobi", "mip", "native"]:
+        raise ValueError('The options for solver are "gurobi", "mip" or "native"')
+
+    G = as_networkx(G)
+    red_vertices = set(red_vertices or [])
+    blue_vertices = set(blue_vertices or [])
+
+    tvb_vertices = trivially_blue_vertices(G) if presolve else set()
+    # As in kl_gurobi and kl_mip, a red vertex that is not in G cannot be red.
+    if any(x not in G for x in red_vertices) or red_vertices & tvb_vertices:
+        return None, None, "infeasible"
+
+    # The time limit applies to the whole call. It can also be given as TimeLimit or
+    # max_seconds, and each component gets the remaining time in the keyword of its solver.
+    limits = [kwargs.pop(key, None) for key in ["TimeLimit", "max_seconds"]] + [time_limit]
+    limits = [limit for limit in limits if limit is not None]
+    deadline = time.time() + min(limits) if limits else None
+
+    small_components, large_components = [], []
+    remaining = G.subgraph([x for x in G.nodes() if x not in tvb_vertices])
+    for C in sorted(nx.connected_components(remaining), key=len, reverse=True):
+        H = _component_graph(G, C)
+        job = (H, red_vertices & C, blue_vertices & C)
+        if len([x for x in C if G.degree[x] % 2 == 0]) <= small:
+            small_components.append(job)
+        else:
+            large_components.append(job)
+
+    results = [kl_brute_force(*job) for job in small_components]
+    if processes == 1 or len(large_components) <= 1:
+        results += [
+            _solve_component(solver, H, red, blue, deadline, kwargs)
+            for H, red, blue in large_components
+        ]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [
+                pool.submit(_solve_component, solver, H, red, blue, deadline, kwargs)
+                for H, red, blue in large_components
+            ]
+            results += [future.result() for future in futures]
+
+    return _merge_results(results)
+
+
+# The keyword of the time limit of each solver.
+_TIME_LIMIT = {"gurobi": "TimeLimit", "mip": "max_seconds", "native": "TimeLimit"}
+
+# The statuses of the solvers other than "infeasible", from best to worst.
+_STATUSES = ["optimal", "gap", "solutionlimit", "nodelimit", "timelimit", "interrupted"]
+
+
+def _component_graph(G, C):
+    # The trivially blue vertices are blue in every coloring and never violate their own
+    # condition, so the components of the remaining graph can be solved independently.
+    # Each removed neighbor is replaced by a private leaf, which keeps the degrees of the
+    # vertices in C and is blue itself, since it has odd degree.
+    H = G.subgraph(C).copy()
+    for x in C:
+        for i in range(G.degree[x] - H.degree[x]):
+            H.add_edge(x, _Leaf(x, i))
+    return H
+
+
+def _solve_component(solver, H, red_vertices, blue_vertices, deadline, kwargs):
+    kwargs = dict(kwargs)
+    if deadline is not None:
+        kwargs[_TIME_LIMIT[solver]] = max(0, deadline - time.time())
+    solve = {"gurobi": kl_gurobi, "mip": kl_mip, "native": kl_branch_and_bound}[solver]
+    return solve(H, red_vertices=list(red_vertices), blue_vertices=list(blue_vertices), **kwargs)
+
+
+def _merge_results(results):
+    # The status of the whole graph is the worst status of a component, in the order of
+    # _STATUSES, or None if a component has an unknown status.
+    statuses = [result[2] if result is not None else None for result in results]
+    if "infeasible" in statuses:
+        return None, None, "infeasible"
+    if all(status in _STATUSES for status in statuses):
+        status = max(statuses, key=_STATUSES.index, default="optimal")
+    else:
+        status = None
+    if any(result is None or result[0] is None for result in results):
+        return None, None, status
+    value = sum(result[0] for result in results)
+    red_vertices = [v for result in results for v in result[1] if not isinstance(v, _Leaf)]
+    return value, red_vertices, status
+
+
+def kl_brute_force(G, red_vertices=None, blue_vertices=None):
+    nodes = list(G.nodes())
+    index = {x: i for i, x in enumerate(nodes)}
+    neighbors = [[index[y] for y in G.neighbors(x)] for x in nodes]
+    red_vertices = set(red_vertices or [])
+    blue_vertices = set(blue_vertices or [])
+
+    fixed = [index[x] for x in red_vertices]
+    free = [
+        index[x]
+        for x in nodes
+        if G.degree[x] % 2 == 0 and x not in red_vertices and x not in blue_vertices
+    ]
+    if any(G.degree[x] % 2 == 1 or x in blue_vertices for x in red_vertices):
+        return None, None, "infeasible"
+
+    best = None
+    for choice in it.product([False, True], repeat=len(free)):
+        red = [False] * len(nodes)
+        for i in fixed:
+            red[i] = True
+        for i, is_red in zip(free, choice):
+            red[i] = is_red
+        if all(
+            (2 * sum(red[j] for j in neighbors[i]) == len(neighbors[i])) == red[i]
+            for i in range(len(nodes))
+        ):
+            if best is None or sum(red) > sum(best):
+                best = red
+
+    if best is None:
+        return None, None, "infeasible"
+    return sum(best), [x for x, is_red in zip(nodes, best) if is_red], "optimal"
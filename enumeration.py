@@ -0,0 +1,184 @@
+import hashlib
+import json
+
+from session import SolverSession
+from stats import _json_default
+from symmetry import automorphism_group, canonical_coloring, symmetry_breaking_pairs
+from verify import verify_coloring
+
+
+def enumerate_optima(
+    G,
+    solver="gurobi",
+    formulation="standard",
+    automorphisms=None,
+    path=None,
+    batch=1000,
+    presolve=True,
+    **params,
+):
+    # Generates the optimal colorings of G, one red vertex list per orbit under the
+    # automorphisms (a list of dicts as from symmetry.grid_automorphisms, or "detect"),
+    # each as its canonical_coloring, and appends them to the file at path, if given, as
+    # JSON lines while they are generated. The automorphisms also add the symmetry breaking
+    # rows of kl_gurobi, which keep a coloring of every orbit.
+    #
+    # G is solved once in a SolverSession, with the optimum as a cutoff. Then the optimal
+    # colorings with some vertices fixed are collected, at most batch of them at a time:
+    # from the solution pool with PoolSearchMode=2 for Gurobi, and one by one with a no-good
+    # cut after each for python-mip. If batch distinct red sets are found, there may be more,
+    # and the search splits on a vertex red in some and blue in others of them. The memory is
+    # that of one batch, the fixed vertices of the open subproblems and a 16-byte digest per
+    # orbit.
+    #
+    # The pool search of Gurobi does not finish on the model of "indicator", so "standard"
+    # is used instead, which has the same colorings.
+    if batch < 2:
+        raise ValueError("batch must be at least 2, to split on a vertex between two colorings")
+    if formulation == "indicator":
+        formulation = "standard"
+    automorphisms = automorphisms or []
+    if automorphisms == "detect":
+        automorphisms = automorphism_group(G)
+    session = SolverSession(G, solver, formulation, presolve=presolve, **params)
+    nodes = list(G.nodes())
+    pairs = symmetry_breaking_pairs(nodes, automorphisms)
+    _add_symmetry_breaking(session, pairs)
+    value, _, status = session.solve()
+    if status != "optimal":
+        raise ValueError(f"G was not solved to optimality, the status is {status!r}")
+    session.set_cutoff(value)
+    if solver == "gurobi":
+        # The pool needs every solution, not only the first.
+        session.model.Params.SolutionLimit = 2000000000
+        session.model.Params.PoolSearchMode = 2
+        session.model.Params.PoolSolutions = batch
+
+        def solutions(fixed, red_sets):
+            return _gurobi_solutions(session, fixed, red_sets, value)
+
+    else:
+
+        def solutions(fixed, red_sets):
+            # CBC can return a stale solution, or crash, when a model is changed and solved
+            # again, so every solve has a model of its own.
+            fresh = SolverSession(G, solver, sparse_model=session.sparse_model, **params)
+            _add_symmetry_breaking(fresh, pairs)
+            fresh.set_cutoff(value)
+            return _mip_solutions(fresh, fixed, red_sets, value)
+
+    index = {x: i for i, x in enumerate(nodes)}
+    seen = set()
+    f = open(path, "w") if path is not None else None
+    try:
+        subproblems = [{}]
+        while subproblems:
+            fixed = subproblems.pop()
+            colorings, complete = _optima(G, solutions, fixed, value, batch, solver)
+            for red_vertices in colorings:
+                canonical = canonical_coloring(red_vertices, automorphisms, index)
+                digest = hashlib.blake2b(
+                    json.dumps([index[x] for x in canonical]).encode(), digest_size=16
+                ).digest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                if f is not None:
+                    f.write(json.dumps(canonical, default=_json_default) + "\n")
+                    f.flush()
+                yield canonical
+            if not complete:
+                red_sets = [set(red_vertices) for red_vertices in colorings]
+                x = next(
+                    (
+                        x
+                        for x in session.red
+                        if x not in fixed and 0 < sum(x in red for red in red_sets) < len(red_sets)
+                    ),
+                    None,
+                )
+                # Distinct red sets of the same size always differ on a free vertex.
+                if x is not None:
+                    subproblems += [{**fixed, x: 0}, {**fixed, x: 1}]
+    finally:
+        if f is not None:
+            f.close()
+
+
+def _add_symmetry_breaking(session, pairs):
+    # Vertices removed by the presolve are blue.
+    for v, w in pairs:
+        if v in session.red or w in session.red:
+            row = session.red.get(v, 0) >= session.red.get(w, 0)
+            if session.solver == "gurobi":
+                session.model.addConstr(row)
+            else:
+                session.model.add_constr(row)
+
+
+def _optima(G, solutions, fixed, value, batch, solver):
+    # Up to batch optimal colorings with distinct red sets and the vertices in fixed set to 0
+    # (blue) or 1 (red), and whether these are all of them. Solutions that differ only in
+    # the auxiliary variables, which some formulations leave free for red vertices, have
+    # the same red set and count once. If the pool of Gurobi fills up with such copies of
+    # fewer than batch red sets, these red sets are cut off and the pool is filled again.
+    nodes = list(G.nodes())
+    colorings = {}
+    while len(colorings) < batch:
+        found = solutions(fixed, list(colorings))
+        for red_set in found:
+            violations, red_count = verify_coloring(G, red_set)
+            if violations or red_count != value:
+                raise ValueError(
+                    f"The solver returned an invalid coloring with {red_count} red vertices"
+                )
+        new = [red_set for red_set in dict.fromkeys(found) if red_set not in colorings]
+        for red_set in new:
+            colorings[red_set] = [x for x in nodes if x in red_set]
+        # The pool of Gurobi holds batch solutions, and python-mip returns at most one.
+        if len(found) < (batch if solver == "gurobi" else 1):
+            return list(colorings.values()), True
+        if not new or value == 0:
+            # Only the empty coloring has no red vertex.
+            return list(colorings.values()), value == 0
+    return list(colorings.values()), False
+
+
+def _gurobi_solutions(session, fixed, red_sets, value):
+    # The red sets of the solution pool with the vertices in fixed set, and a no-good row for
+    # each of red_sets, since every other optimal coloring has a blue vertex among them.
+    red = session.red
+    if not red:
+        # The presolve removed every vertex.
+        return [frozenset()]
+    bounds = [(red[x], color) for x, color in fixed.items()]
+    session._set_bounds(bounds)
+    rows = [session._add_row([red[x] for x in red_set], value - 1) for red_set in red_sets]
+    try:
+        m = session.model
+        m.optimize()
+        found = []
+        for k in range(m.SolCount):
+            m.Params.SolutionNumber = k
+            found.append(frozenset(x for x in red if red[x].Xn >= 0.95))
+        return found
+    finally:
+        session._remove_rows(rows)
+        session._set_bounds([(var, None) for var, _ in bounds])
+
+
+def _mip_solutions(session, fixed, red_sets, value):
+    # The red set of the first solution found with the vertices in fixed set and a no-good
+    # row for each of red_sets, in a model that is solved only once.
+    import mip
+
+    red = session.red
+    if not red:
+        return [frozenset()]
+    session._set_bounds([(red[x], color) for x, color in fixed.items()])
+    for red_set in red_sets:
+        session._add_row([red[x] for x in red_set], value - 1)
+    status = session.model.optimize(max_solutions=1)
+    if status not in [mip.OptimizationStatus.OPTIMAL, mip.OptimizationStatus.FEASIBLE]:
+        return []
+    return [frozenset(x for x in red if red[x].x >= 0.95)]
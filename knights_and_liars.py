@@ -1,6 +1,7 @@
 import networkx as nx
 import time
 import itertools as it
+import math
 
 
 def kl_gurobi(
@@ -15,14 +16,55 @@ def kl_gurobi(
     MIPFocus=None,
     Symmetry=None,
     TimeLimit=None,
+    NodeLimit=None,
+    MIPGap=0,
+    matrix_api=False,
+    sparse_model=None,
+    lazy=False,
+    presolve=False,
+    automorphisms=None,
+    start=None,
+    callback=None,
+    stats=None,
+    max_rows=None,
+    max_memory=None,
 ):
 
     import gurobipy as gp
 
+    started = time.time()
+
     if print_program:
         with open(__file__) as f:
             print(f.read())
 
+    # The guards use the size of the model without presolve, an upper bound otherwise.
+    if formulation == "auto":
+        from selection import choose_formulation
+
+        formulation = choose_formulation(
+            G,
+            "gurobi",
+            max_rows,
+            drop_optional=drop_optional,
+            lazy=lazy,
+            max_memory=max_memory,
+            matrix_api=matrix_api or presolve,
+        )
+    elif sparse_model is None and (max_rows is not None or max_memory is not None):
+        from selection import check_model_size
+
+        check_model_size(
+            G,
+            formulation,
+            "gurobi",
+            max_rows,
+            max_memory,
+            drop_optional,
+            lazy,
+            matrix_api or presolve,
+        )
+
     m = gp.Model()
 
     if formulation not in [
@@ -34,9 +76,17 @@ def kl_gurobi(
     ]:
         raise ValueError(
             'The options for formulation are "standard",'
-            '"bosch_subsets", "alternative", or "indicator"'
+            '"bosch_subsets", "alternative", "indicator", or "auto"'
         )
-    if formulation == "standard":
+    if matrix_api or presolve or sparse_model is not None:
+        from sparse_model import build_sparse_model, to_gurobi
+
+        if sparse_model is None:
+            sparse_model = build_sparse_model(G, formulation, drop_optional, lazy, presolve)
+        formulation, lazy = sparse_model.formulation, sparse_model.lazy
+        red = to_gurobi(sparse_model, m)
+
+    elif formulation == "standard":
         red = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes()}
         high = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes() if G.degree(x) % 2 == 0}
         low = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes() if G.degree(x) % 2 == 0}
@@ -57,7 +107,7 @@ def kl_gurobi(
                 m.addConstr(sum([red[y] for y in neighbors]) >= (deg // 2 + 1) * high[x])
                 m.addConstr(sum([red[y] for y in neighbors]) <= deg - (deg // 2 + 1) * low[x])
 
-    if formulation == "bosch":
+    elif formulation == "bosch":
         red = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes()}
         high = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes() if G.degree(x) % 2 == 0}
         low = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes() if G.degree(x) % 2 == 0}
@@ -83,7 +133,7 @@ def kl_gurobi(
                     sum([red[y] for y in neighbors]) <= (deg // 2 - 1) + (deg // 2 + 1) * low[x]
                 )
 
-    if formulation == "bosch_subsets":
+    elif formulation == "bosch_subsets":
         red = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes()}
 
         m.setObjective(sum(red.values()), gp.GRB.MAXIMIZE)
@@ -96,6 +146,8 @@ def kl_gurobi(
                 neighbors = list(G.neighbors(x))
                 m.addConstr(sum([red[y] for y in neighbors]) <= deg - (deg // 2) * red[x])
                 m.addConstr(sum([red[y] for y in neighbors]) >= (deg // 2) * red[x])
+                if lazy:
+                    continue
                 for S in it.combinations(neighbors, deg // 2):
                     T = [neighbor for neighbor in neighbors if neighbor not in S]
                     m.addConstr(
@@ -103,7 +155,7 @@ def kl_gurobi(
                         <= deg // 2 - 1
                     )
 
-    if formulation == "alternative":
+    elif formulation == "alternative":
         red = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes()}
         aux = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes() if G.degree(x) % 2 == 0}
 
@@ -126,7 +178,7 @@ def kl_gurobi(
                     >= (deg // 2 + 1) * aux[x] - (deg // 2 + 1) * red[x]
                 )
 
-    if formulation == "indicator":
+    elif formulation == "indicator":
         red = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes()}
         high = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes() if G.degree(x) % 2 == 0}
         low = {x: m.addVar(vtype=gp.GRB.BINARY) for x in G.nodes() if G.degree(x) % 2 == 0}
@@ -145,12 +197,31 @@ def kl_gurobi(
                 m.addConstr((low[x] == 1) >> (sum([red[y] for y in neighbors]) >= deg // 2 + 1))
 
     if red_vertices is not None:
+        if any(vertex not in red for vertex in red_vertices):
+            return None, None, "infeasible"
         for vertex in red_vertices:
             m.addConstr(red[vertex] == 1)
 
     if blue_vertices is not None:
         for vertex in blue_vertices:
-            m.addConstr(red[vertex] == 0)
+            if vertex in red:
+                m.addConstr(red[vertex] == 0)
+
+    if not red:
+        return 0, [], "optimal"
+
+    if automorphisms is not None:
+        from symmetry import automorphism_group, symmetry_breaking_pairs
+
+        if automorphisms == "detect":
+            automorphisms = automorphism_group(G)
+        for v, w in symmetry_breaking_pairs(red, automorphisms, red_vertices, blue_vertices):
+            m.addConstr(red[v] >= red[w])
+
+    if start is not None:
+        start = set(start)
+        for v in red:
+            red[v].Start = 1 if v in start else 0
 
     if OutputFlag is not None:
         m.Params.OutputFlag = OutputFlag
@@ -163,22 +234,207 @@ def kl_gurobi(
         m.Params.Symmetry = Symmetry
     if TimeLimit is not None:
         m.Params.TimeLimit = TimeLimit
+    if NodeLimit is not None:
+        m.Params.NodeLimit = NodeLimit
+
+    m.Params.MIPGap = MIPGap
+
+    if lazy and formulation == "bosch_subsets":
+        neighborhoods = _even_neighborhoods(G, red)
+
+        def separate(model, where):
+            if where == gp.GRB.Callback.MIPSOL:
+                values = dict(zip(red, model.cbGetSolution(variables)))
+                add = model.cbLazy
+            elif (
+                where == gp.GRB.Callback.MIPNODE
+                and model.cbGet(gp.GRB.Callback.MIPNODE_STATUS) == gp.GRB.OPTIMAL
+            ):
+                values = dict(zip(red, model.cbGetNodeRel(variables)))
+                add = model.cbCut
+            else:
+                return False
+            violated = _violated_subsets(neighborhoods, values)
+            for x, S, T in violated:
+                add(
+                    -red[x] + gp.quicksum(red[s] for s in S) - gp.quicksum(red[t] for t in T)
+                    <= len(S) - 1
+                )
+            return len(violated) > 0
+
+        m.Params.LazyConstraints = 1
+        m.Params.PreCrush = 1
+    else:
+        separate = None
+
+    solve_started = time.time()
+    if separate is not None or callback is not None or stats is not None:
+        variables = list(red.values())
+        best = [None]
+
+        def solver_callback(model, where):
+            if stats is not None:
+                phase = _gurobi_phase(model, where)
+                if phase is not None:
+                    stats.mark(phase, model.cbGet(gp.GRB.Callback.RUNTIME))
+            # A solution that violates a lazy constraint is rejected, so it is not reported.
+            if separate is not None and separate(model, where):
+                return
+            if callback is None or where != gp.GRB.Callback.MIPSOL:
+                return
+            value = round(model.cbGet(gp.GRB.Callback.MIPSOL_OBJ))
+            if best[0] is not None and value <= best[0]:
+                return
+            best[0] = value
+            values = model.cbGetSolution(variables)
+            red_vertices = [v for v, x in zip(red, values) if x >= 0.95]
+            bound = model.cbGet(gp.GRB.Callback.MIPSOL_OBJBND)
+            if callback(_incumbent(value, red_vertices, bound, started)):
+                model.terminate()
+
+        m.optimize(solver_callback)
+    else:
+        m.optimize()
+
+    result = _gurobi_result(m, red)
+    if stats is not None:
+        size = {
+            "variables": m.getAttr("NumVars"),
+            "rows": m.getAttr("NumConstrs"),
+            "nonzeros": m.getAttr("NumNZs"),
+            "indicators": m.getAttr("NumGenConstrs"),
+        }
+        bound = m.getAttr("ObjBound") if m.status != gp.GRB.INFEASIBLE else None
+        _record_stats(
+            stats,
+            "gurobi",
+            formulation,
+            started,
+            solve_started,
+            size,
+            round(m.getAttr("NodeCount")),
+            result,
+            bound,
+        )
+    return result
 
-    m.Params.MIPGap = 0
 
-    m.optimize()
+def _gurobi_result(m, red):
+    # The result of a solved model, with the best coloring found if a limit was hit.
+    import gurobipy as gp
 
+    limits = {
+        gp.GRB.TIME_LIMIT: "timelimit",
+        gp.GRB.NODE_LIMIT: "nodelimit",
+        gp.GRB.SOLUTION_LIMIT: "solutionlimit",
+        gp.GRB.INTERRUPTED: "interrupted",
+    }
+    result = None
     if m.status == gp.GRB.OPTIMAL:
-        return round(m.getAttr("ObjVal")), [v for v in red if red[v].X >= 0.95], "optimal"
-    elif m.status == gp.GRB.TIME_LIMIT:
-        try:
-            return round(m.getAttr("ObjVal")), [v for v in red if red[v].X >= 0.95], "timelimit"
-        except Exception as e:
-            print("Timelimit hit, no feasible solution was found.")
-            print(e)
-            return None, None, "timelimit"
+        value = round(m.getAttr("ObjVal"))
+        status = _gap_status(value, m.getAttr("ObjBound"))
+        result = value, [v for v in red if red[v].X >= 0.95], status
+    elif m.status in limits:
+        if m.getAttr("SolCount") == 0:
+            result = None, None, limits[m.status]
+        else:
+            value = round(m.getAttr("ObjVal"))
+            result = value, [v for v in red if red[v].X >= 0.95], limits[m.status]
     elif m.status == gp.GRB.INFEASIBLE:
-        return None, None, "infeasible"
+        result = None, None, "infeasible"
+    return result
+
+
+def _gurobi_phase(model, where):
+    # Gurobi presolves, solves the root relaxation and then branches, and the callback of
+    # each step tells it apart. MIP callbacks at node 0 still belong to the root. MIPSOL
+    # is left out, since heuristics can find solutions even before the presolve.
+    import gurobipy as gp
+
+    cb = gp.GRB.Callback
+    if where == cb.PRESOLVE:
+        return "presolve"
+    if where in [cb.SIMPLEX, cb.BARRIER]:
+        return "root"
+    node_counts = {cb.MIP: cb.MIP_NODCNT, cb.MIPNODE: cb.MIPNODE_NODCNT}
+    if where in node_counts:
+        return "root" if model.cbGet(node_counts[where]) == 0 else "branch"
+    return None
+
+
+def _record_stats(stats, solver, formulation, started, solve_started, size, nodes, result, bound):
+    value, status = (None, None) if result is None else (result[0], result[2])
+    bound = None if bound is None else _integral_bound(bound)
+    gap = None if value is None or bound is None else _gap(value, bound)
+    stats.record(
+        solver,
+        formulation,
+        started,
+        solve_started - started,
+        time.time() - solve_started,
+        size,
+        nodes,
+        value,
+        bound,
+        gap,
+        status,
+    )
+
+
+def _even_neighborhoods(G, red):
+    # Vertices without a variable in red were fixed blue by the presolve and contribute
+    # nothing to the neighbor sums, but the degrees are still those of G.
+    return [
+        (x, [y for y in G.neighbors(x) if y in red], G.degree[x] // 2)
+        for x in red
+        if G.degree[x] % 2 == 0
+    ]
+
+
+def _violated_subsets(neighborhoods, values, tol=1e-6):
+    # For a fixed vertex x, the left-hand side -red[x] + sum(S) - sum(T) of the subset
+    # inequalities is maximized by taking S as the deg // 2 neighbors of largest value.
+    violated = []
+    for x, neighbors, half in neighborhoods:
+        ranked = sorted(neighbors, key=values.__getitem__, reverse=True)
+        S, T = ranked[:half], ranked[half:]
+        lhs = -values[x] + sum(values[s] for s in S) - sum(values[t] for t in T)
+        if lhs > half - 1 + tol:
+            violated.append((x, S, T))
+    return violated
+
+
+def _incumbent(value, red_vertices, bound, started):
+    bound = _integral_bound(bound)
+    return {
+        "value": value,
+        "red_vertices": red_vertices,
+        "bound": bound,
+        "gap": _gap(value, bound),
+        "time": time.time() - started,
+    }
+
+
+def _integral_bound(bound):
+    # Since the objective is integral, the bound can be rounded down. Bounds of 1e100 and
+    # more stand for no bound at all.
+    return math.floor(bound + 1e-6) if bound < 1e100 else math.inf
+
+
+def _gap(value, bound):
+    # The relative gap as defined by Gurobi. Since the objective is integral, the bound can
+    # be rounded down, so a gap of 0 proves optimality.
+    if bound >= 1e100:
+        return math.inf
+    bound = math.floor(bound + 1e-6)
+    if bound <= value:
+        return 0.0
+    return (bound - value) / value if value else math.inf
+
+
+def _gap_status(value, bound):
+    # Solvers also report "optimal" once the relative gap is below a positive MIPGap.
+    return "optimal" if _gap(value, bound) == 0 else "gap"
 
 
 def kl_mip(
@@ -187,17 +443,60 @@ def kl_mip(
     blue_vertices=None,
     formulation="standard",
     print_program=False,
+    drop_optional=False,
     verbose=None,
     threads=None,
     emphasis=None,
+    max_seconds=None,
+    max_nodes=None,
+    max_gap=0,
+    matrix_api=False,
+    sparse_model=None,
+    lazy=False,
+    presolve=False,
+    automorphisms=None,
+    start=None,
+    callback=None,
+    stats=None,
+    max_rows=None,
+    max_memory=None,
 ):
 
     import mip
 
+    started = time.time()
+
     if print_program:
         with open(__file__) as f:
             print(f.read())
 
+    # The guards use the size of the model without presolve, an upper bound otherwise.
+    if formulation == "auto":
+        from selection import choose_formulation
+
+        formulation = choose_formulation(
+            G,
+            "mip",
+            max_rows,
+            drop_optional=drop_optional,
+            lazy=lazy,
+            max_memory=max_memory,
+            matrix_api=matrix_api or presolve,
+        )
+    elif sparse_model is None and (max_rows is not None or max_memory is not None):
+        from selection import check_model_size
+
+        check_model_size(
+            G,
+            formulation,
+            "mip",
+            max_rows,
+            max_memory,
+            drop_optional,
+            lazy,
+            matrix_api or presolve,
+        )
+
     m = mip.Model(sense=mip.MAXIMIZE, solver_name=mip.CBC)
 
     if formulation not in [
@@ -207,10 +506,19 @@ def kl_mip(
         "alternative",
     ]:
         raise ValueError(
-            'The options for formulation are "standard",' '"bosch_subsets", or "alternative"'
+            'The options for formulation are "standard",'
+            '"bosch_subsets", "alternative", or "auto"'
         )
 
-    if formulation == "standard":
+    if matrix_api or presolve or sparse_model is not None:
+        from sparse_model import build_sparse_model, to_mip
+
+        if sparse_model is None:
+            sparse_model = build_sparse_model(G, formulation, drop_optional, lazy, presolve)
+        formulation, lazy = sparse_model.formulation, sparse_model.lazy
+        red = to_mip(sparse_model, m)
+
+    elif formulation == "standard":
         red = {x: m.add_var(var_type=mip.BINARY) for x in G.nodes()}
         high = {x: m.add_var(var_type=mip.BINARY) for x in G.nodes() if G.degree(x) % 2 == 0}
         low = {x: m.add_var(var_type=mip.BINARY) for x in G.nodes() if G.degree(x) % 2 == 0}
@@ -225,7 +533,8 @@ def kl_mip(
                 neighbors = list(G.neighbors(x))
                 m += mip.xsum([red[y] for y in neighbors]) <= deg - (deg // 2) * red[x]
                 m += mip.xsum([red[y] for y in neighbors]) >= (deg // 2) * red[x]
-                m += high[x] + low[x] <= 1 + red[x]
+                if not drop_optional:
+                    m += high[x] + low[x] <= 1 + red[x]
                 m += high[x] + low[x] >= 1 - red[x]
                 m += mip.xsum([red[y] for y in neighbors]) <= deg - (deg // 2 + 1) * low[x]
                 m += mip.xsum([red[y] for y in neighbors]) >= (deg // 2 + 1) * high[x]
@@ -243,12 +552,19 @@ def kl_mip(
                 m += red[x] == 0
             else:
                 neighbors = list(G.neighbors(x))
-                m += sum([red[y] for y in neighbors]) <= deg - (deg // 2) * red[x]
-                m += sum([red[y] for y in neighbors]) >= (deg // 2) * red[x]
-                m += high[x] + low[x] >= 1 + red[x]
+                m += mip.xsum([red[y] for y in neighbors]) <= deg - (deg // 2) * red[x]
+                m += mip.xsum([red[y] for y in neighbors]) >= (deg // 2) * red[x]
+                if not drop_optional:
+                    m += high[x] + low[x] >= 1 + red[x]
                 m += high[x] + low[x] <= 1 + red[x]
-                m += sum([red[y] for y in neighbors]) >= (deg // 2 + 1) - (deg // 2 + 1) * high[x]
-                m += sum([red[y] for y in neighbors]) <= (deg // 2 - 1) + (deg // 2 + 1) * low[x]
+                m += (
+                    mip.xsum([red[y] for y in neighbors])
+                    >= (deg // 2 + 1) - (deg // 2 + 1) * high[x]
+                )
+                m += (
+                    mip.xsum([red[y] for y in neighbors])
+                    <= (deg // 2 - 1) + (deg // 2 + 1) * low[x]
+                )
 
     elif formulation == "alternative":
         red = {x: m.add_var(var_type=mip.BINARY) for x in G.nodes()}
@@ -272,7 +588,7 @@ def kl_mip(
                     >= (deg // 2 + 1) * aux[x] - (deg // 2 + 1) * red[x]
                 )
 
-    if formulation == "bosch_subsets":
+    elif formulation == "bosch_subsets":
         red = {x: m.add_var(var_type=mip.BINARY) for x in G.nodes()}
 
         m.objective = mip.xsum(red.values())
@@ -285,20 +601,40 @@ def kl_mip(
                 neighbors = list(G.neighbors(x))
                 m += mip.xsum([red[y] for y in neighbors]) <= deg - (deg // 2) * red[x]
                 m += mip.xsum([red[y] for y in neighbors]) >= (deg // 2) * red[x]
+                if lazy:
+                    continue
                 for S in it.combinations(neighbors, deg // 2):
                     T = [neighbor for neighbor in neighbors if neighbor not in S]
                     m += (
-                        -red[x] + sum([red[s] for s in S]) - sum([red[t] for t in T])
+                        -red[x] + mip.xsum([red[s] for s in S]) - mip.xsum([red[t] for t in T])
                         <= deg // 2 - 1
                     )
 
     if red_vertices is not None:
+        if any(vertex not in red for vertex in red_vertices):
+            return None, None, "infeasible"
         for vertex in red_vertices:
             m += red[vertex] == 1
 
     if blue_vertices is not None:
         for vertex in blue_vertices:
-            m += red[vertex] == 0
+            if vertex in red:
+                m += red[vertex] == 0
+
+    if not red:
+        return 0, [], "optimal"
+
+    if automorphisms is not None:
+        from symmetry import automorphism_group, symmetry_breaking_pairs
+
+        if automorphisms == "detect":
+            automorphisms = automorphism_group(G)
+        for v, w in symmetry_breaking_pairs(red, automorphisms, red_vertices, blue_vertices):
+            m += red[v] >= red[w]
+
+    if start is not None:
+        start = set(start)
+        m.start = [(red[v], 1.0 if v in start else 0.0) for v in red]
 
     if verbose is not None:
         m.verbose = verbose
@@ -309,20 +645,182 @@ def kl_mip(
     if threads is not None:
         m.threads = threads
 
-    m.max_gap = 0
-    status = m.optimize()
+    m.max_mip_gap = max_gap
+    limits = {}
+    if max_seconds is not None:
+        limits["max_seconds"] = max_seconds
+    if max_nodes is not None:
+        limits["max_nodes"] = max_nodes
+    solve_started = time.time()
+    if lazy and formulation == "bosch_subsets":
+        neighborhoods = _even_neighborhoods(G, red)
+        status, interrupted, m, red = _mip_optimize_separating(
+            m, red, neighborhoods, callback, started, limits
+        )
+    elif callback is None:
+        status = m.optimize(**limits)
+        interrupted = False
+    else:
+        status, interrupted = _mip_optimize_reporting(m, red, callback, started, limits)
+
+    # CBC reports both limits in the same way, so they are told apart by the time.
+    if interrupted:
+        limit = "interrupted"
+    elif max_seconds is not None and time.time() - started >= max_seconds:
+        limit = "timelimit"
+    elif max_nodes is not None:
+        limit = "nodelimit"
+    else:
+        limit = None
+    result = _mip_result(m, red, status, limit)
+
+    if stats is not None:
+        # python-mip does not report the number of branch-and-bound nodes of CBC.
+        size = {
+            "variables": m.num_cols,
+            "rows": m.num_rows,
+            "nonzeros": m.num_nz,
+            "indicators": 0,
+        }
+        bound = m.objective_bound if status != mip.OptimizationStatus.INFEASIBLE else None
+        _record_stats(stats, "mip", formulation, started, solve_started, size, None, result, bound)
+    return result
+
+
+def _mip_result(m, red, status, limit):
+    # The result of a solved model. The limit is the status for FEASIBLE and
+    # NO_SOLUTION_FOUND, which CBC returns for every limit.
+    import mip
 
+    result = None
     if status == mip.OptimizationStatus.OPTIMAL:
-        return round(m.objective_value), [v for v in red if red[v].x >= 0.95], "optimal"
+        value = round(m.objective_value)
+        result = value, [v for v in red if red[v].x >= 0.95], _gap_status(value, m.objective_bound)
 
     elif status == mip.OptimizationStatus.INFEASIBLE:
-        return None, None, "infeasible"
+        result = None, None, "infeasible"
+
+    elif status == mip.OptimizationStatus.NO_SOLUTION_FOUND:
+        result = None, None, limit
+
+    elif status == mip.OptimizationStatus.FEASIBLE:
+        result = round(m.objective_value), [v for v in red if red[v].x >= 0.95], limit
+    return result
+
+
+def _mip_optimize_separating(m, red, neighborhoods, callback, started, limits):
+    # CBC can return an integer solution again after a lazy constraint has cut it off, and
+    # then loops until the time limit, and it can return a stale solution or crash when a
+    # solved model is changed and solved again. So the subset inequalities are separated
+    # between solves, each on a fresh copy of m: _mip_watch_solutions collects the violated
+    # ones of every integer solution CBC finds, and they are all added for the next solve,
+    # until its solution satisfies all of them. Every round adds a new row, so this
+    # terminates. The inequality of a vertex without neighbors is added before the first
+    # solve, so that no model has only empty rows. Incumbents that violate one are not
+    # reported. Returns the last status, whether the callback asked to stop, and the last
+    # model with its variables in red.
+    import mip
+
+    # The inequality of a vertex without neighbors makes it red.
+    for x, neighbors, half in neighborhoods:
+        if half == 0:
+            m += red[x] >= 1
+    rows = {}
+
+    def check(values):
+        violated = _violated_subsets(neighborhoods, values)
+        for x, S, T in violated:
+            rows.setdefault((x, tuple(S)), (x, S, T))
+        return not violated
+
+    if callback is not None:
+        report = callback
+        best = [None]
+
+        def callback(incumbent):
+            if best[0] is not None and incumbent["value"] <= best[0]:
+                return False
+            best[0] = incumbent["value"]
+            return report(incumbent)
+
+    model, variables = m, red
+    while True:
+        round_limits = dict(limits)
+        if "max_seconds" in limits:
+            remaining = limits["max_seconds"] - (time.time() - started)
+            round_limits["max_seconds"] = max(0, remaining)
+        if callback is not None:
+            status, interrupted = _mip_optimize_reporting(
+                model, variables, callback, started, round_limits, check
+            )
+        else:
+            _mip_watch_solutions(model, variables, check)
+            status, interrupted = model.optimize(**round_limits), False
+        if status not in [mip.OptimizationStatus.OPTIMAL, mip.OptimizationStatus.FEASIBLE]:
+            return status, interrupted, model, variables
+        if check({x: variables[x].x for x in variables}):
+            return status, interrupted, model, variables
+        # A solve stopped by a limit or the callback leaves no valid coloring.
+        out_of_time = "max_seconds" in limits and time.time() - started >= limits["max_seconds"]
+        if interrupted or out_of_time or status == mip.OptimizationStatus.FEASIBLE:
+            return mip.OptimizationStatus.NO_SOLUTION_FOUND, interrupted, model, variables
+        model = m.copy()
+        for name in ["verbose", "threads", "emphasis", "max_mip_gap"]:
+            setattr(model, name, getattr(m, name))
+        if m.start:
+            model.start = [(model.vars[var.idx], value) for var, value in m.start]
+        variables = {x: model.vars[var.idx] for x, var in red.items()}
+        for x, S, T in rows.values():
+            model += (
+                -variables[x]
+                + mip.xsum(variables[s] for s in S)
+                - mip.xsum(variables[t] for t in T)
+                <= len(S) - 1
+            )
+
+
+def _mip_optimize_reporting(m, red, callback, started, limits, check=None):
+    # Solves m once and reports every improving coloring from _mip_watch_solutions, unless
+    # check returns False for its values. CBC cannot be stopped from there, so once the
+    # callback asks to stop, no more colorings are reported and the solve runs on to its
+    # limits. Returns the status and whether the callback asked to stop.
+    best = [None]
+    stopped = [False]
+
+    def watch(values):
+        if check is not None and not check(values) or stopped[0]:
+            return
+        red_vertices = [x for x in red if values[x] >= 0.95]
+        value = len(red_vertices)
+        if best[0] is not None and value <= best[0]:
+            return
+        best[0] = value
+        # The generator sees no global bound.
+        stopped[0] = callback(_incumbent(value, red_vertices, math.inf, started))
+
+    _mip_watch_solutions(m, red, watch)
+    return m.optimize(**limits), stopped[0]
+
+
+def _mip_watch_solutions(m, red, watch):
+    # python-mip has no incumbent callback for CBC, but CBC calls the lazy constraint
+    # generator on every integer solution it finds. This one adds no rows and only calls
+    # watch with the values of the variables in red. CBC turns off its preprocessing and
+    # heuristics for it, so the columns it sees are those of m.
+    import mip
+
+    class Watcher(mip.ConstrsGenerator):
+        def generate_constrs(self, model, depth=0, npass=0):
+            columns = model.vars
+            watch({x: columns[var.idx].x for x, var in red.items()})
+
+    m.lazy_constrs_generator = Watcher()
 
 
 if __name__ == "__main__":
     G = nx.grid_graph(dim=[7, 7])
     for formulation in ["alternative", "standard", "bosch", "bosch_subsets"]:
-        val, rv, status = kl_mip(G, formulation="alternative", verbose=False, threads=1)
+        val, rv, status = kl_mip(G, formulation=formulation, verbose=False, threads=1)
         print(val, rv, status)
-        val, rv, status = kl_gurobi(G, formulation="alternative", OutputFlag=False, Threads=1)
+        val, rv, status = kl_gurobi(G, formulation=formulation, OutputFlag=False, Threads=1)
         print(val, rv, status)
@@ -0,0 +1,231 @@
+import itertools as it
+import math
+
+import numpy as np
+
+from csr_graph import CSRGraph
+
+
+class _Lattice:
+    # The vertices are the positions of a box of the given shape that lie in the lattice,
+    # numbered in C order, and the neighbors of a position p are the positions p + o for the
+    # offsets o that stay in the lattice, with periodic axes wrapping around. Degrees and
+    # neighbors are computed from the coordinates, and 0/1 arrays over the vertex numbers
+    # are processed by shifting them once per offset, so no adjacency is ever stored. The
+    # subclasses define index, vertex, nodes, _inside and _mask, the positions of the box
+    # in the lattice, or None for all.
+    def __init__(self, shape, periodic, offsets):
+        self.shape = tuple(shape)
+        self.periodic = tuple(periodic)
+        self.offsets = offsets
+
+    def neighbors(self, x):
+        for o in self.offsets:
+            y = tuple(
+                (c + d) % size if periodic else c + d
+                for c, d, size, periodic in zip(x, o, self.shape, self.periodic)
+            )
+            if self._inside(y):
+                yield y
+
+    @property
+    def degree(self):
+        return _DegreeView(self)
+
+    def edges(self):
+        for x in self.nodes():
+            i = self.index(x)
+            for y in self.neighbors(x):
+                if self.index(y) > i:
+                    yield x, y
+
+    def degree_array(self):
+        ones = np.ones(self.number_of_nodes(), dtype=np.int16)
+        return self.red_neighbor_counts(ones).astype(np.int64)
+
+    def red_neighbor_counts(self, X):
+        # The number of red neighbors of every vertex, for a 0/1 array over the vertex
+        # numbers, or for one coloring per row of a matrix. The counts are int16, which is
+        # enough for the degrees of lattices and keeps the shifted copies small.
+        X = np.asarray(X)
+        box = self._to_box(X.astype(np.int16), 0)
+        counts = np.zeros_like(box)
+        for o in self.offsets:
+            counts += self._shift(box, o, 0)
+        return self._from_box(counts)
+
+    def trivially_blue_mask(self):
+        # As utility.trivially_blue_mask, one round of the propagation per step, with the
+        # blue-neighbor counts of all vertices recomputed by red_neighbor_counts.
+        deg = self.degree_array().astype(np.int16)
+        blue = deg % 2 == 1
+        while True:
+            new = blue | (2 * self.red_neighbor_counts(blue) > deg)
+            if np.array_equal(new, blue):
+                return blue
+            blue = new
+
+    def to_csr(self):
+        # Materializes the lattice as a CSRGraph with the same vertex numbers, for the
+        # solvers that need the whole adjacency, like the MIP models.
+        n = self.number_of_nodes()
+        box = self._to_box(np.arange(n, dtype=np.int64), -1)
+        u, v = [], []
+        for o in self.offsets:
+            target = self._shift(box, o, -1)
+            keep = (box >= 0) & (target >= 0)
+            u.append(box[keep])
+            v.append(target[keep])
+        mask = self._mask()
+        if mask is None:
+            coords = np.indices(self.shape, dtype=np.int32).reshape(len(self.shape), -1).T
+        else:
+            coords = np.argwhere(mask).astype(np.int32)
+        u = np.concatenate(u) if u else np.zeros(0, dtype=np.int64)
+        v = np.concatenate(v) if v else np.zeros(0, dtype=np.int64)
+        return CSRGraph.from_edges(n, u, v, coords)
+
+    def subgraph(self, nodes):
+        return self.to_csr().subgraph(nodes)
+
+    def number_of_edges(self):
+        return int(self.degree_array().sum()) // 2
+
+    def __len__(self):
+        return self.number_of_nodes()
+
+    def __iter__(self):
+        return self.nodes()
+
+    def __contains__(self, x):
+        return (
+            isinstance(x, tuple)
+            and len(x) == len(self.shape)
+            and all(isinstance(c, (int, np.integer)) for c in x)
+            and self._inside(x)
+        )
+
+    def _to_box(self, X, fill):
+        mask = self._mask()
+        if mask is None:
+            return X.reshape(X.shape[:-1] + self.shape)
+        box = np.full(X.shape[:-1] + self.shape, fill, dtype=X.dtype)
+        box[..., mask] = X
+        return box
+
+    def _from_box(self, box):
+        mask = self._mask()
+        if mask is None:
+            return box.reshape(box.shape[: box.ndim - len(self.shape)] + (-1,))
+        return box[..., mask]
+
+    def _shift(self, box, o, fill):
+        # The array whose value at p is that of box at p + o, or fill outside the box.
+        result = box
+        for axis, (d, periodic) in enumerate(zip(o, self.periodic)):
+            if d == 0:
+                continue
+            axis -= len(self.shape)
+            if periodic:
+                result = np.roll(result, -d, axis=axis)
+                continue
+            shifted = np.full_like(result, fill)
+            size = result.shape[axis]
+            source = [slice(None)] * result.ndim
+            target = [slice(None)] * result.ndim
+            source[axis] = slice(max(d, 0), size + min(d, 0))
+            target[axis] = slice(max(-d, 0), size - max(d, 0))
+            shifted[tuple(target)] = result[tuple(source)]
+            result = shifted
+        return result
+
+
+class GridLattice(_Lattice):
+    # The grid with the given side lengths in any dimension, as nx.grid_2d_graph(m, n) for
+    # two, with the vertices (i, j, ...) in the same order. periodic is one flag for all
+    # axes or one per axis, and periodic axes of length 2 or less add no edges, as in
+    # networkx.
+    def __init__(self, dims, periodic=False):
+        if isinstance(periodic, bool):
+            periodic = [periodic] * len(dims)
+        if len(periodic) != len(dims):
+            raise ValueError("periodic needs one flag per dimension")
+        periodic = [p and size > 2 for p, size in zip(periodic, dims)]
+        offsets = []
+        for axis, size in enumerate(dims):
+            for d in [1, -1]:
+                o = [0] * len(dims)
+                o[axis] = d
+                offsets.append(tuple(o))
+        super().__init__(dims, periodic, offsets)
+
+    def index(self, x):
+        i = 0
+        for c, size in zip(x, self.shape):
+            i = i * size + c
+        return i
+
+    def vertex(self, i):
+        x = []
+        for size in reversed(self.shape):
+            i, c = divmod(i, size)
+            x.append(c)
+        return tuple(reversed(x))
+
+    def nodes(self):
+        return it.product(*[range(size) for size in self.shape])
+
+    def number_of_nodes(self):
+        return math.prod(self.shape)
+
+    def _inside(self, x):
+        return all(0 <= c < size for c, size in zip(x, self.shape))
+
+    def _mask(self):
+        return None
+
+
+class TriangleLattice(_Lattice):
+    # The triangular grid of side n of utility.triangle_graph, with the vertices (i, j),
+    # 0 <= j <= i <= n, in the same order, and the neighbors (i, j +- 1), (i +- 1, j) and
+    # (i +- 1, j +- 1).
+    def __init__(self, n):
+        self.n = n
+        offsets = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (-1, -1)]
+        super().__init__((n + 1, n + 1), (False, False), offsets)
+
+    def index(self, x):
+        i, j = x
+        return i * (i + 1) // 2 + j
+
+    def vertex(self, k):
+        i = (math.isqrt(8 * k + 1) - 1) // 2
+        return i, k - i * (i + 1) // 2
+
+    def nodes(self):
+        return ((i, j) for i in range(self.n + 1) for j in range(i + 1))
+
+    def number_of_nodes(self):
+        return (self.n + 1) * (self.n + 2) // 2
+
+    def _inside(self, x):
+        i, j = x
+        return 0 <= j <= i <= self.n
+
+    def _mask(self):
+        return np.tri(self.n + 1, dtype=bool)
+
+
+class _DegreeView:
+    # G.degree[x], G.degree(x) and G.degree(), as for networkx graphs.
+    def __init__(self, G):
+        self._G = G
+
+    def __getitem__(self, x):
+        return sum(1 for _ in self._G.neighbors(x))
+
+    def __call__(self, x=None):
+        return iter(self) if x is None else self[x]
+
+    def __iter__(self):
+        return zip(self._G.nodes(), self._G.degree_array().tolist())
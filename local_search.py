@@ -0,0 +1,256 @@
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from csr_graph import CSRGraph
+from utility import trivially_blue_vertices
+
+
+def kl_local_search(
+    G,
+    red_vertices=None,
+    blue_vertices=None,
+    iterations=100000,
+    windows=2000,
+    window_size=24,
+    starts=None,
+    processes=None,
+    seed=0,
+    start=None,
+    TimeLimit=None,
+):
+    # Runs _tabu_search from several seeds on a process pool, each followed by
+    # _window_search from its best coloring. The result is the best valid coloring found,
+    # so its value is a lower bound for kl(G) and it can be passed on as a start. The
+    # status is "feasible", or None if no coloring respecting the fixed vertices was found.
+    # The first run starts from start if given, the others from all blue.
+    red_vertices = set(red_vertices or [])
+    blue_vertices = set(blue_vertices or [])
+    if starts is None:
+        starts = os.cpu_count() or 1
+
+    jobs = [
+        (
+            G,
+            red_vertices,
+            blue_vertices,
+            iterations,
+            windows,
+            window_size,
+            seed + k,
+            start if k == 0 else None,
+            TimeLimit,
+        )
+        for k in range(starts)
+    ]
+    if processes == 1 or starts == 1:
+        results = [_tabu_search(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_tabu_search, *zip(*jobs)))
+
+    results = [red for red in results if red is not None]
+    if not results:
+        return None, None, None
+    best = max(results, key=len)
+    return len(best), best, "feasible"
+
+
+def _tabu_search(
+    G,
+    red_vertices,
+    blue_vertices,
+    iterations,
+    windows,
+    window_size,
+    seed,
+    start,
+    TimeLimit,
+    weight=2.5,
+    tenure=5,
+):
+    # Min-conflicts tabu search over all colorings, valid or not. Each step picks a random
+    # violated vertex and flips the best vertex among it and its neighbors that is not tabu,
+    # scored by the change of the number of red vertices minus weight times the change of
+    # the penalties, see _penalty. Once the coloring is valid, it is recorded and a random
+    # blue vertex is made red. The red-neighbor counts and penalties are kept up to date,
+    # so a flip costs O(deg) and scoring a flip O(deg) as well.
+    rng = random.Random(seed)
+    deadline = None if TimeLimit is None else time.time() + TimeLimit
+    nodes = list(G.nodes())
+    index = {x: i for i, x in enumerate(nodes)}
+    if isinstance(G, CSRGraph):
+        neighbors = [nbrs.tolist() for nbrs in G.neighbor_lists()]
+    else:
+        neighbors = [[index[y] for y in G.neighbors(x)] for x in nodes]
+    deg = [len(nbrs) for nbrs in neighbors]
+
+    tvb_vertices = trivially_blue_vertices(G)
+    if any(x not in index or x in tvb_vertices or x in blue_vertices for x in red_vertices):
+        return None
+    free = [
+        index[x]
+        for x in nodes
+        if x not in tvb_vertices and x not in red_vertices and x not in blue_vertices
+    ]
+    is_free = [False] * len(nodes)
+    for i in free:
+        is_free[i] = True
+
+    start = set(start or [])
+    red = [x in red_vertices or (x in start and is_free[index[x]]) for x in nodes]
+    count = [sum(red[j] for j in neighbors[i]) for i in range(len(nodes))]
+    penalty = [_penalty(red[i], count[i], deg[i]) for i in range(len(nodes))]
+
+    # The violated vertices, as a list with positions for O(1) updates and random choices.
+    violated = [i for i in range(len(nodes)) if penalty[i] > 0]
+    position = {i: k for k, i in enumerate(violated)}
+
+    def set_penalty(i, p):
+        if p > 0 and penalty[i] == 0:
+            position[i] = len(violated)
+            violated.append(i)
+        elif p == 0 and penalty[i] > 0:
+            k = position.pop(i)
+            last = violated.pop()
+            if last != i:
+                violated[k] = last
+                position[last] = k
+        penalty[i] = p
+
+    def score(v):
+        sign = -1 if red[v] else 1
+        change = _penalty(not red[v], count[v], deg[v]) - penalty[v]
+        for j in neighbors[v]:
+            change += _penalty(red[j], count[j] + sign, deg[j]) - penalty[j]
+        return sign - weight * change
+
+    def flip(v):
+        sign = -1 if red[v] else 1
+        red[v] = not red[v]
+        set_penalty(v, _penalty(red[v], count[v], deg[v]))
+        for j in neighbors[v]:
+            count[j] += sign
+            set_penalty(j, _penalty(red[j], count[j], deg[j]))
+
+    value = sum(red)
+    best = None
+    tabu = [0] * len(nodes)
+    for step in range(iterations):
+        if deadline is not None and step % 1000 == 0 and time.time() > deadline:
+            break
+        if not violated:
+            if best is None or value > len(best):
+                best = [nodes[i] for i in range(len(nodes)) if red[i]]
+            blue = [i for i in free if not red[i]]
+            if not blue:
+                break
+            v = rng.choice(blue)
+        else:
+            c = violated[rng.randrange(len(violated))]
+            candidates = [i for i in [c] + neighbors[c] if is_free[i] and tabu[i] <= step]
+            if not candidates:
+                continue
+            v = max(candidates, key=lambda i: (score(i), rng.random()))
+        value += -1 if red[v] else 1
+        flip(v)
+        tabu[v] = step + tenure + rng.randrange(tenure)
+
+    if not violated and (best is None or value > len(best)):
+        best = [nodes[i] for i in range(len(nodes)) if red[i]]
+    if best is None or not windows or not free:
+        return best
+    best = set(index[x] for x in best)
+    red = [i in best for i in range(len(nodes))]
+    _window_search(neighbors, deg, free, is_free, red, windows, window_size, rng, deadline)
+    return [nodes[i] for i in range(len(nodes)) if red[i]]
+
+
+def _window_search(neighbors, deg, free, is_free, red, windows, size, rng, deadline):
+    # Large neighborhood search on a valid coloring, which is changed in place. Each step
+    # takes a window of up to size free vertices, grown by breadth-first search from a
+    # random free vertex, and replaces the colors in it by a coloring of the window with
+    # as many red vertices or more, while all other vertices keep their colors, see
+    # _best_window.
+    # Single flips rarely lead from one valid coloring to a larger one, since a red vertex
+    # needs its red neighbors to be added along with it, but a window can add or move whole
+    # cycles of red vertices at once.
+    count = [sum(red[j] for j in neighbors[i]) for i in range(len(red))]
+    for step in range(windows):
+        if deadline is not None and step % 10 == 0 and time.time() > deadline:
+            break
+        first = rng.choice(free)
+        window, seen = [first], {first}
+        k = 0
+        while k < len(window) and len(window) < size:
+            candidates = [j for j in neighbors[window[k]] if is_free[j] and j not in seen]
+            rng.shuffle(candidates)
+            for j in candidates[: size - len(window)]:
+                seen.add(j)
+                window.append(j)
+            k += 1
+        for v, is_red in _best_window(neighbors, deg, red, count, window, rng).items():
+            if is_red != red[v]:
+                red[v] = is_red
+                for j in neighbors[v]:
+                    count[j] += 1 if is_red else -1
+
+
+def _best_window(neighbors, deg, red, count, window, rng, max_nodes=1000):
+    # A coloring of the window with at least as many red vertices as the current one, such
+    # that the window and its neighbors are valid, by depth-first search in the order of
+    # the window. A red vertex fails as soon as more than half of its neighbors are red or
+    # too few of them are left to reach half, and a blue vertex once all its neighbors are
+    # colored. Ties are broken randomly, so that the search can move on plateaus. After
+    # max_nodes nodes, the best coloring found so far is returned, or none.
+    in_window = set(window)
+    checked = in_window.union(*(neighbors[v] for v in window))
+    counts = {c: count[c] - sum(red[j] for j in neighbors[c] if j in in_window) for c in checked}
+    open_neighbors = {c: sum(j in in_window for j in neighbors[c]) for c in checked}
+    colors = {c: red[c] for c in checked if c not in in_window}
+    first = [rng.random() < 0.5 for _ in window]
+    best = [sum(red[v] for v in window) - 1, None]
+    nodes = [0]
+
+    def violated(c):
+        # Whether c is colored and cannot be valid any more.
+        color = colors.get(c)
+        if color is None:
+            return False
+        if color:
+            return not counts[c] <= deg[c] // 2 <= counts[c] + open_neighbors[c]
+        return open_neighbors[c] == 0 and 2 * counts[c] == deg[c]
+
+    def search(k, value):
+        nodes[0] += 1
+        if value + len(window) - k <= best[0] or nodes[0] > max_nodes:
+            return
+        if k == len(window):
+            best[0], best[1] = value, {v: colors[v] for v in window}
+            return
+        v = window[k]
+        for color in [first[k], not first[k]]:
+            if color and deg[v] % 2 == 1:
+                continue
+            colors[v] = color
+            for j in neighbors[v]:
+                counts[j] += color
+                open_neighbors[j] -= 1
+            if not violated(v) and not any(violated(j) for j in neighbors[v]):
+                search(k + 1, value + color)
+            for j in neighbors[v]:
+                counts[j] -= color
+                open_neighbors[j] += 1
+            del colors[v]
+
+    search(0, 0)
+    return best[1] or {}
+
+
+def _penalty(red, count, deg):
+    # A red vertex is off by |2 * count - deg|, which guides the search towards exactly
+    # half of the neighbors, and a blue vertex is violated only if it has exactly half.
+    if red:
+        return abs(2 * count - deg)
+    return int(2 * count == deg)
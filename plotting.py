@@ -7,10 +7,13 @@ import itertools as it
 from subprocess import Popen
 import math
 
+from csr_graph import as_networkx
+
 
 def draw_graph_with_labels(
     G, red_vertices, blue_vertices, pos=None, with_labels=True, node_size=200, font_size=11
 ):
+    G = as_networkx(G)
     cmap = []
     for vertex in G.nodes():
         if vertex in red_vertices:
@@ -128,31 +131,34 @@ def triangle_to_eps(red_vertices, n, name):
 
 
 if __name__ == "__main__":
-    from knights_and_liars import kl_gurobi
+    from cache import ResultCache
+    from verify import verify_coloring
+
+    cache = ResultCache("tmp/kl_cache")
 
     for n in range(4, 15 + 1):
         G = nx.grid_2d_graph(m=n, n=n, periodic=False)
-        _, red_vertices, _ = kl_gurobi(G, OutputFlag=False, Threads=1)
+        _, red_vertices, _ = cache.solve(G, OutputFlag=False, Threads=1)
         grid_to_eps(red_vertices, n, n, f"grid_{n}")
 
     Tor_12_27 = nx.grid_2d_graph(m=12, n=27, periodic=True)
-    _, red_vertices, _ = kl_gurobi(Tor_12_27, OutputFlag=False, Threads=1)
+    _, red_vertices, _ = cache.solve(Tor_12_27, OutputFlag=False, Threads=1)
     grid_to_eps(red_vertices, 12, 27, name="torus_12_27")
 
     Path_16 = nx.grid_2d_graph(m=1, n=16, periodic=False)
-    _, red_vertices, _ = kl_gurobi(Path_16, OutputFlag=False, Threads=1)
+    _, red_vertices, _ = cache.solve(Path_16, OutputFlag=False, Threads=1)
     grid_to_eps(red_vertices, 1, 16, "grid_1_16")
 
     Grid_4_15 = nx.grid_2d_graph(m=4, n=15, periodic=False)
-    _, red_vertices, _ = kl_gurobi(Grid_4_15, OutputFlag=False, Threads=1)
+    _, red_vertices, _ = cache.solve(Grid_4_15, OutputFlag=False, Threads=1)
     grid_to_eps(red_vertices, 4, 15, "grid_4_15")
 
     Grid_7_32 = nx.grid_2d_graph(m=7, n=32, periodic=False)
-    _, red_vertices, _ = kl_gurobi(Grid_7_32, OutputFlag=False, Threads=1)
+    _, red_vertices, _ = cache.solve(Grid_7_32, OutputFlag=False, Threads=1)
     grid_to_eps(red_vertices, 7, 32, "grid_7_32")
 
     Grid_8_32 = nx.grid_2d_graph(m=8, n=32, periodic=False)
-    _, red_vertices, _ = kl_gurobi(Grid_8_32, OutputFlag=False, Threads=1)
+    _, red_vertices, _ = cache.solve(Grid_8_32, OutputFlag=False, Threads=1)
     grid_to_eps(red_vertices, 8, 32, "grid_8_32")
 
     tri_16_1 = [
@@ -1028,6 +1034,17 @@ if __name__ == "__main__":
     pattern_6_2 = [(1, 1), (2, 1), (3, 1), (4, 1), (1, 3), (2, 3), (3, 3), (4, 3), (1, 2), (4, 2)]
     grids_to_eps([pattern_6_1, pattern_6_2], 6, [4, 5], "height_6_patterns")
 
+    for red_vertices, m, n in [
+        (opt_16, 16, 16),
+        (opt_17, 17, 17),
+        (opt_18, 18, 18),
+        (ex_19_144, 19, 19),
+        (ex_20_160, 20, 20),
+    ]:
+        violated, _ = verify_coloring(nx.grid_2d_graph(m, n), red_vertices)
+        if violated:
+            raise ValueError(f"The coloring of the {m} x {n} grid is not valid at {violated}")
+
     grid_to_eps(opt_16, 16, 16, "grid_16")
     grid_to_eps(opt_17, 17, 17, "grid_17")
     grid_to_eps(opt_18, 18, 18, "grid_18")
@@ -0,0 +1,188 @@
+import json
+import math
+import statistics
+
+import numpy as np
+
+from csr_graph import degree_array
+from sparse_model import estimate_memory, model_size
+
+# Formulations ranked by build_profile, per backend, degree class and size class, from runs
+# of benchmark.py with one thread and a time limit of 60 seconds on grids (8, 11, 14), tori
+# (8 x 8, 12 x 12), triangular graphs (9, 15), random 4-, 6- and 8-regular graphs with 24
+# to 150 vertices and the hypercubes of dimension 4 and 6.
+PROFILE = {
+    "gurobi": {
+        "low": {
+            "small": ["bosch_subsets", "standard", "indicator", "alternative", "bosch"],
+            "large": ["alternative", "standard", "bosch_subsets", "bosch", "indicator"],
+        },
+        "medium": {
+            "small": ["alternative", "bosch", "indicator", "standard", "bosch_subsets"],
+            "large": ["alternative", "bosch", "indicator", "standard", "bosch_subsets"],
+        },
+        "high": {
+            "small": ["indicator", "alternative", "bosch", "standard", "bosch_subsets"],
+            "large": ["indicator", "alternative", "standard", "bosch", "bosch_subsets"],
+        },
+    },
+    "mip": {
+        "low": {
+            "small": ["bosch", "bosch_subsets", "alternative", "standard"],
+            "large": ["bosch", "standard", "bosch_subsets", "alternative"],
+        },
+        "medium": {
+            "small": ["bosch", "alternative", "standard", "bosch_subsets"],
+            "large": ["alternative", "bosch", "standard", "bosch_subsets"],
+        },
+        "high": {
+            "small": ["alternative", "bosch", "standard", "bosch_subsets"],
+            "large": ["standard", "bosch", "alternative", "bosch_subsets"],
+        },
+    },
+}
+
+FORMULATIONS = {
+    "gurobi": ["standard", "bosch", "bosch_subsets", "alternative", "indicator"],
+    "mip": ["standard", "bosch", "bosch_subsets", "alternative"],
+}
+
+MAX_ROWS = 10**6
+
+
+def degree_class(deg):
+    # The largest even degree decides the size of the subset inequalities, and the
+    # neighbor sums get longer with it for all formulations.
+    even = deg[deg % 2 == 0]
+    d = int(even.max()) if len(even) else 0
+    if d <= 4:
+        return "low"
+    if d <= 6:
+        return "medium"
+    return "high"
+
+
+def size_class(deg):
+    # Only vertices of even degree contribute constraints beyond red[x] == 0.
+    return "small" if np.count_nonzero(deg % 2 == 0) <= 100 else "large"
+
+
+def choose_formulation(
+    G,
+    solver="gurobi",
+    max_rows=None,
+    profile=None,
+    drop_optional=False,
+    lazy=False,
+    max_memory=None,
+    matrix_api=False,
+):
+    # Picks the first formulation in the ranking of the profile for the backend and the
+    # classes of G that fits into max_rows (by default MAX_ROWS) and max_memory, see
+    # model_fits. Classes missing from the profile fall back to the nearest size class and
+    # then to the order of FORMULATIONS. Raises ValueError if no formulation fits.
+    if solver not in FORMULATIONS:
+        raise ValueError('The options for solver are "gurobi" or "mip"')
+    profile = PROFILE if profile is None else profile
+    max_rows = MAX_ROWS if max_rows is None else max_rows
+    deg = degree_array(G)
+
+    ranking = profile.get(solver, {}).get(degree_class(deg), {})
+    ranking = ranking.get(size_class(deg)) or next(iter(ranking.values()), [])
+    candidates = list(dict.fromkeys(ranking + FORMULATIONS[solver]))
+    for formulation in candidates:
+        if formulation not in FORMULATIONS[solver]:
+            continue
+        fits, _ = model_fits(
+            deg, formulation, solver, max_rows, max_memory, drop_optional, lazy, matrix_api
+        )
+        if fits:
+            return formulation
+    raise ValueError(
+        f"No formulation fits into max_rows={max_rows} and max_memory={max_memory} "
+        f"for solver={solver!r}"
+    )
+
+
+def model_fits(
+    deg,
+    formulation,
+    solver="gurobi",
+    max_rows=None,
+    max_memory=None,
+    drop_optional=False,
+    lazy=False,
+    matrix_api=False,
+):
+    # Whether the model has at most max_rows rows, indicator constraints included, and an
+    # estimated memory of at most max_memory bytes, Python and solver side together.
+    # Limits that are None are not checked. Returns the result and the size, with the
+    # memory estimate added, without building anything.
+    size = model_size(deg, formulation, drop_optional, lazy)
+    size["memory"] = estimate_memory(size, solver, matrix_api)["total"]
+    fits = (max_rows is None or size["rows"] + size["indicators"] <= max_rows) and (
+        max_memory is None or size["memory"] <= max_memory
+    )
+    return fits, size
+
+
+def check_model_size(
+    G,
+    formulation,
+    solver="gurobi",
+    max_rows=None,
+    max_memory=None,
+    drop_optional=False,
+    lazy=False,
+    matrix_api=False,
+):
+    # Fails fast with ValueError, before anything is built, if the model does not fit.
+    deg = degree_array(G)
+    fits, size = model_fits(
+        deg, formulation, solver, max_rows, max_memory, drop_optional, lazy, matrix_api
+    )
+    if not fits:
+        raise ValueError(
+            f"The formulation {formulation!r} needs {size['rows'] + size['indicators']} rows "
+            f"and about {size['memory'] / 2**20:.0f} MB, more than max_rows={max_rows} or "
+            f'max_memory={max_memory}; formulation="auto" picks one that fits'
+        )
+
+
+def build_profile(records, penalty=10):
+    # Ranks the formulations of each backend by the geometric mean of their time relative
+    # to the fastest formulation on the same instance, over the instances of each degree
+    # and size class. Runs that stopped before proving optimality count with penalty times
+    # their time, up to twice that for a gap of 100% or more, and failed runs with penalty
+    # times the slowest run on the instance. The records are those of run_benchmark.
+    from benchmark import FAMILIES
+
+    times = {}
+    for r in records:
+        G = FAMILIES[r["family"]](r["size"])
+        deg = degree_array(G)
+        key = (r["backend"], degree_class(deg), size_class(deg))
+        instance = (r["family"], json.dumps(r["size"]))
+        t = None
+        if r["solve_time"] is not None:
+            t = r["build_time"] + r["solve_time"]
+            if r["status"] != "optimal":
+                gap = 1 if r["gap"] is None else min(r["gap"], 1)
+                t *= penalty * (1 + gap)
+        runs = times.setdefault(key, {}).setdefault(instance, {})
+        runs.setdefault(r["formulation"], []).append(t)
+
+    profile = {}
+    for (backend, degrees, size), instances in times.items():
+        ratios = {}
+        for runs in instances.values():
+            finished = [t for ts in runs.values() for t in ts if t is not None]
+            if not finished:
+                continue
+            fastest, failed = max(min(finished), 1e-6), penalty * max(finished)
+            for f, ts in runs.items():
+                t = statistics.median([failed if t is None else t for t in ts])
+                ratios.setdefault(f, []).append(math.log(max(t, 1e-6) / fastest))
+        ranking = sorted(ratios, key=lambda f: statistics.mean(ratios[f]))
+        profile.setdefault(backend, {}).setdefault(degrees, {})[size] = ranking
+    return profile
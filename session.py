@@ -0,0 +1,206 @@
+import time
+
+from knights_and_liars import _gurobi_result, _mip_result
+from sparse_model import build_sparse_model, to_gurobi, to_mip
+
+
+class SolverSession:
+    # Builds the model of G for one formulation once, through build_sparse_model, and
+    # answers queries with fixed red and blue vertices by changing only the bounds of their
+    # variables, which are reset after each query, and optimizing the same model again.
+    # The best coloring found so far that respects the fixed vertices is the MIP start.
+    # Lazy constraints and symmetry breaking would depend on the query and are not
+    # supported. A sparse_model built before can be passed instead of building it again.
+    # The keyword arguments are Gurobi parameters, or attributes of the python-mip model
+    # such as threads or emphasis.
+    def __init__(
+        self,
+        G,
+        solver="gurobi",
+        formulation="standard",
+        drop_optional=False,
+        presolve=False,
+        max_colorings=1000,
+        sparse_model=None,
+        **params,
+    ):
+        if solver not in ["gurobi", "mip"]:
+            raise ValueError('The options for solver are "gurobi" or "mip"')
+        started = time.time()
+        self.solver = solver
+        if sparse_model is None:
+            sparse_model = build_sparse_model(G, formulation, drop_optional, False, presolve)
+        self.sparse_model = sparse_model
+        if solver == "gurobi":
+            import gurobipy as gp
+
+            self.model = gp.Model()
+            self.red = to_gurobi(self.sparse_model, self.model)
+            self.model.Params.OutputFlag = 0
+            self.model.Params.MIPGap = 0
+            for name, value in params.items():
+                self.model.setParam(name, value)
+        else:
+            import mip
+
+            self.model = mip.Model(sense=mip.MAXIMIZE, solver_name=mip.CBC)
+            self.red = to_mip(self.sparse_model, self.model)
+            self.model.verbose = 0
+            self.model.max_mip_gap = 0
+            for name, value in params.items():
+                setattr(self.model, name, value)
+        self.build_time = time.time() - started
+
+        # Valid colorings found by earlier queries, as MIP starts, and the optimal values
+        # of earlier queries, which bound every query that fixes more vertices.
+        self.max_colorings = max_colorings
+        self.colorings = []
+        self.bounds = []
+        self.cutoff = None
+        self.queries = 0
+        self.solves = 0
+
+    def solve(self, red_vertices=None, blue_vertices=None, TimeLimit=None):
+        # Returns (value, red_vertices, status) as kl_gurobi and kl_mip. A query whose
+        # bound from an earlier query is attained by a known coloring, or that fixes more
+        # vertices than an infeasible one, is answered without the solver.
+        self.queries += 1
+        red_vertices = frozenset(red_vertices or [])
+        blue_vertices = frozenset(x for x in blue_vertices or [] if x in self.red)
+        if any(x not in self.red for x in red_vertices) or red_vertices & blue_vertices:
+            return None, None, "infeasible"
+
+        bound = min(
+            (
+                value
+                for red, blue, value in self.bounds
+                if red <= red_vertices and blue <= blue_vertices
+            ),
+            default=None,
+        )
+        start = max(
+            (
+                coloring
+                for coloring in self.colorings
+                if red_vertices <= coloring and not blue_vertices & coloring
+            ),
+            key=len,
+            default=None,
+        )
+        if bound is not None and (bound < 0 or self.cutoff is not None and bound < self.cutoff):
+            return None, None, "infeasible"
+        if self.cutoff is not None and start is not None and len(start) >= self.cutoff:
+            return len(start), list(start), "solutionlimit"
+        if bound is not None and start is not None and len(start) == bound:
+            return len(start), list(start), "optimal"
+
+        if not self.red:
+            # The presolve removed every vertex.
+            return 0, [], "optimal"
+
+        fixed = [(self.red[x], 1) for x in red_vertices]
+        fixed += [(self.red[x], 0) for x in blue_vertices]
+        self._set_bounds(fixed)
+        try:
+            result = self._optimize(start, TimeLimit)
+        finally:
+            self._set_bounds([(var, None) for var, _ in fixed])
+        self.solves += 1
+
+        value, red, status = result if result is not None else (None, None, None)
+        if red is not None:
+            self._remember(frozenset(red))
+        if status in ["optimal", "infeasible"]:
+            self.bounds.append((red_vertices, blue_vertices, -1 if value is None else value))
+        return result
+
+    def solve_forced(self, vertices=None, color="red", TimeLimit=None):
+        # Solves the query with each of the vertices (by default all) fixed to the color, and
+        # returns a dict of the results. The query without fixed vertices comes first, so that
+        # its optimum answers every vertex on which some known optimal coloring agrees.
+        if color not in ["red", "blue"]:
+            raise ValueError('The options for color are "red" or "blue"')
+        if vertices is None:
+            vertices = list(self.red) + self.sparse_model.fixed_blue
+        self.solve(TimeLimit=TimeLimit)
+        results = {}
+        for x in vertices:
+            if color == "red":
+                results[x] = self.solve(red_vertices=[x], TimeLimit=TimeLimit)
+            else:
+                results[x] = self.solve(blue_vertices=[x], TimeLimit=TimeLimit)
+        return results
+
+    def set_cutoff(self, value):
+        # From now on, queries only ask for colorings with at least value red vertices and
+        # stop at the first one found, with the status "solutionlimit", or are infeasible.
+        # The row is added to the model, so the cutoff can only be raised.
+        if self.cutoff is not None and value <= self.cutoff:
+            return
+        self.cutoff = value
+        if self.solver == "gurobi":
+            import gurobipy as gp
+
+            self.model.addConstr(gp.quicksum(self.red.values()) >= value)
+            self.model.Params.SolutionLimit = 1
+        else:
+            import mip
+
+            self.model += mip.xsum(self.red.values()) >= value
+
+    def _add_row(self, variables, rhs):
+        # Adds the row sum(variables) <= rhs and returns it, for _remove_rows.
+        if self.solver == "gurobi":
+            import gurobipy as gp
+
+            return self.model.addConstr(gp.quicksum(variables) <= rhs)
+        import mip
+
+        return self.model.add_constr(mip.xsum(variables) <= rhs)
+
+    def _remove_rows(self, rows):
+        if rows:
+            self.model.remove(rows)
+
+    def _set_bounds(self, fixed):
+        # Fixes each variable to its value, or frees it again for None.
+        for var, value in fixed:
+            lb, ub = (0, 1) if value is None else (value, value)
+            if self.solver == "gurobi":
+                var.LB, var.UB = lb, ub
+            else:
+                var.lb, var.ub = lb, ub
+
+    def _optimize(self, start, TimeLimit):
+        if self.solver == "gurobi":
+            import gurobipy as gp
+
+            for x, var in self.red.items():
+                var.Start = gp.GRB.UNDEFINED if start is None else float(x in start)
+            self.model.Params.TimeLimit = gp.GRB.INFINITY if TimeLimit is None else TimeLimit
+            self.model.optimize()
+            return _gurobi_result(self.model, self.red)
+
+        if start is not None:
+            self.model.start = [(var, float(x in start)) for x, var in self.red.items()]
+        options = {}
+        if TimeLimit is not None:
+            options["max_seconds"] = TimeLimit
+        if self.cutoff is not None:
+            options["max_solutions"] = 1
+        started = time.time()
+        status = self.model.optimize(**options)
+        limit = None
+        if TimeLimit is not None and time.time() - started >= TimeLimit:
+            limit = "timelimit"
+        elif self.cutoff is not None:
+            limit = "solutionlimit"
+        return _mip_result(self.model, self.red, status, limit)
+
+    def _remember(self, coloring):
+        if coloring in self.colorings:
+            return
+        self.colorings.append(coloring)
+        if len(self.colorings) > self.max_colorings:
+            # The smallest colorings are the least useful as starts.
+            self.colorings.remove(min(self.colorings, key=len))
@@ -0,0 +1,339 @@
+import numpy as np
+import scipy.sparse as sp
+import itertools as it
+import math
+
+from csr_graph import adjacency_matrix
+from utility import trivially_blue_mask
+
+
+class SparseModel:
+    def __init__(
+        self,
+        nodes,
+        formulation,
+        lazy,
+        blocks,
+        obj,
+        A,
+        sense,
+        rhs,
+        indicators,
+        fixed_blue,
+        eliminated,
+    ):
+        self.nodes = nodes
+        self.formulation = formulation
+        self.lazy = lazy
+        self.blocks = blocks
+        self.obj = obj
+        self.A = A
+        self.sense = sense
+        self.rhs = rhs
+        self.indicators = indicators
+        self.fixed_blue = fixed_blue
+        self.eliminated = eliminated
+
+    @property
+    def num_vars(self):
+        return len(self.obj)
+
+    @property
+    def num_rows(self):
+        return self.A.shape[0]
+
+    def block(self, name):
+        start, size = self.blocks[name]
+        return slice(start, start + size)
+
+
+def build_sparse_model(G, formulation="standard", drop_optional=False, lazy=False, presolve=False):
+    if formulation not in [
+        "standard",
+        "bosch",
+        "bosch_subsets",
+        "alternative",
+        "indicator",
+    ]:
+        raise ValueError(
+            'The options for formulation are "standard",'
+            '"bosch_subsets", "alternative", or "indicator"'
+        )
+
+    nodes, adjacency = adjacency_matrix(G)
+    deg = np.diff(adjacency.indptr)
+    full_size = model_size(deg, formulation, drop_optional, lazy)
+
+    # The trivially blue vertices are blue in every coloring, and their own constraints are
+    # satisfied automatically. Their variables and rows are removed and their zero
+    # contribution is dropped from the neighbor sums, while degrees stay those of G.
+    fixed_blue = []
+    if presolve:
+        blue = trivially_blue_mask(adjacency.indptr, adjacency.indices)
+        keep = np.flatnonzero(~blue)
+        fixed_blue = [nodes[i] for i in np.flatnonzero(blue)]
+        nodes = [nodes[i] for i in keep]
+        adjacency = adjacency[keep][:, keep]
+        deg = deg[keep]
+
+    n = len(nodes)
+    even = np.flatnonzero(deg % 2 == 0)
+    odd = np.flatnonzero(deg % 2 == 1)
+    k = len(even)
+    half = (deg[even] // 2).astype(float)
+    A_even = adjacency[even]
+    P = sp.csr_array((np.ones(k), (np.arange(k), even)), shape=(k, n))
+    P_odd = sp.csr_array((np.ones(len(odd)), (np.arange(len(odd)), odd)), shape=(len(odd), n))
+    I = sp.identity(k, format="csr")
+    Z = sp.csr_array((k, k))
+    D = sp.diags(half)
+    D1 = sp.diags(half + 1)
+
+    blocks = {"red": (0, n)}
+    if formulation in ["standard", "bosch", "indicator"]:
+        blocks["high"] = (n, k)
+        blocks["low"] = (n + k, k)
+    elif formulation == "alternative":
+        blocks["aux"] = (n, k)
+    num_vars = sum(size for start, size in blocks.values())
+
+    rows, senses, rhs = [], [], []
+
+    def pad(M):
+        return sp.hstack([M, sp.csr_array((M.shape[0], num_vars - M.shape[1]))], format="csr")
+
+    def add(M, sense, b):
+        rows.append(pad(M))
+        senses.append(np.full(M.shape[0], sense))
+        rhs.append(np.broadcast_to(np.asarray(b, dtype=float), M.shape[0]))
+
+    add(P_odd, "=", 0)
+
+    if formulation != "indicator":
+        add(A_even + D @ P, "<", deg[even])
+        add(A_even - D @ P, ">", 0)
+
+    if formulation == "standard":
+        if not drop_optional:
+            add(sp.hstack([-P, I, I]), "<", 1)
+        add(sp.hstack([P, I, I]), ">", 1)
+        add(sp.hstack([A_even, -D1, Z]), ">", 0)
+        add(sp.hstack([A_even, Z, D1]), "<", deg[even])
+
+    elif formulation == "bosch":
+        if not drop_optional:
+            add(sp.hstack([-P, I, I]), ">", 1)
+        add(sp.hstack([-P, I, I]), "<", 1)
+        add(sp.hstack([A_even, D1, Z]), ">", half + 1)
+        add(sp.hstack([A_even, Z, -D1]), "<", half - 1)
+
+    elif formulation == "alternative":
+        add(sp.hstack([A_even - D1 @ P, -D1]), "<", half - 1)
+        add(sp.hstack([A_even + D1 @ P, -D1]), ">", 0)
+
+    elif formulation == "bosch_subsets" and not lazy:
+        # All vertices of the same degree share the sign patterns of the subsets S, so the
+        # rows for one degree class are built from its neighbor index matrix in one go.
+        inner = np.diff(adjacency.indptr)
+        for d, c in sorted(set(zip(deg[even].tolist(), inner[even].tolist()))):
+            vertices = even[(deg[even] == d) & (inner[even] == c)]
+            neighbors = adjacency.indices[adjacency.indptr[vertices][:, None] + np.arange(c)]
+            patterns = -np.ones((math.comb(c, d // 2), c))
+            for row, S in enumerate(it.combinations(range(c), d // 2)):
+                patterns[row, list(S)] = 1
+            num = len(patterns)
+            row_ids = np.arange(len(vertices) * num).repeat(c + 1)
+            cols = np.concatenate(
+                [np.repeat(neighbors, num, axis=0), np.repeat(vertices, num)[:, None]], axis=1
+            )
+            vals = np.concatenate(
+                [np.tile(patterns, (len(vertices), 1)), -np.ones((len(vertices) * num, 1))],
+                axis=1,
+            )
+            M = sp.csr_array(
+                (vals.ravel(), (row_ids, cols.ravel())), shape=(len(vertices) * num, n)
+            )
+            add(M, "<", d // 2 - 1)
+
+    indicators = []
+    if formulation == "indicator":
+        high = n + np.arange(k)
+        low = high + k
+        indicators.append((even, False, pad(sp.hstack([sp.csr_array((k, n)), I, I])), "=", 1))
+        indicators.append((even, True, pad(A_even), "=", half))
+        indicators.append((high, True, pad(A_even), "<", half - 1))
+        indicators.append((low, True, pad(A_even), ">", half + 1))
+
+    obj = np.zeros(num_vars)
+    obj[:n] = 1
+
+    A = sp.vstack(rows, format="csr")
+    eliminated = {
+        "vertices": len(fixed_blue),
+        "variables": full_size["variables"] - num_vars,
+        "rows": full_size["rows"] - A.shape[0],
+        "indicators": full_size["indicators"] - sum(len(ind[0]) for ind in indicators),
+    }
+
+    return SparseModel(
+        nodes,
+        formulation,
+        lazy,
+        blocks,
+        obj,
+        A,
+        np.concatenate(senses),
+        np.concatenate(rhs),
+        indicators,
+        fixed_blue,
+        eliminated,
+    )
+
+
+def model_size(deg, formulation, drop_optional=False, lazy=False):
+    # The exact numbers of variables, rows, nonzeros and indicator constraints, with the
+    # nonzeros of their linear expressions, of the model that kl_gurobi, kl_mip and
+    # build_sparse_model build without presolve, computed from the degree sequence alone.
+    # An odd vertex has the row red[x] == 0, and an even vertex of degree d has rows with
+    # d + 1 or d + 2 nonzeros, and C(d, d / 2) subset inequalities for bosch_subsets. The
+    # coefficient d / 2 of red[x] in its first two rows is 0 for an isolated vertex, and
+    # is not stored.
+    if formulation not in ["standard", "bosch", "bosch_subsets", "alternative", "indicator"]:
+        raise ValueError(
+            'The options for formulation are "standard",'
+            '"bosch_subsets", "alternative", or "indicator"'
+        )
+    deg = np.asarray(deg, dtype=np.int64)
+    even = deg[deg % 2 == 0]
+    k, num_odd = len(even), len(deg) - len(even)
+    aux = {"standard": 2, "bosch": 2, "alternative": 1, "indicator": 2, "bosch_subsets": 0}
+    rows = {
+        "standard": 6 - drop_optional,
+        "bosch": 6 - drop_optional,
+        "alternative": 4,
+        "indicator": 0,
+        "bosch_subsets": 2,
+    }
+    nonzeros = {
+        "standard": 4 * (even.sum() + k) + (6 - 3 * drop_optional) * k,
+        "bosch": 4 * (even.sum() + k) + (6 - 3 * drop_optional) * k,
+        "alternative": 4 * even.sum() + 6 * k,
+        "indicator": 0,
+        "bosch_subsets": 2 * (even.sum() + k),
+    }
+    size = {
+        "variables": len(deg) + aux[formulation] * k,
+        "rows": num_odd + rows[formulation] * k,
+        "nonzeros": num_odd + int(nonzeros[formulation]),
+        "indicators": 4 * k if formulation == "indicator" else 0,
+        "indicator_nonzeros": int(3 * even.sum() + 2 * k) if formulation == "indicator" else 0,
+    }
+    if formulation != "indicator":
+        size["nonzeros"] -= 2 * int((even == 0).sum())
+    if formulation == "bosch_subsets" and not lazy:
+        for d, count in zip(*np.unique(even, return_counts=True)):
+            subsets = math.comb(int(d), int(d) // 2)
+            size["rows"] += int(count) * subsets
+            size["nonzeros"] += int(count) * subsets * (int(d) + 1)
+    return size
+
+
+# Bytes per model as a fixed amount, per variable, per row (indicator constraints included)
+# and per nonzero, fitted to the peak RSS of building and of the first seconds of solving
+# grids and random regular graphs with up to 200000 rows. The Python side includes the
+# copy of the model held by the solver library, which is built along with it. The solver
+# side covers presolve and LP, not the search tree, which grows with the run time, and
+# its coefficients are those of CBC with the fixed amount of Gurobi for kl_gurobi, since
+# larger Gurobi models could not be measured with a size-limited license.
+_PYTHON_MEMORY = {
+    ("gurobi", False): (0, 510, 320, 22),
+    ("gurobi", True): (10 * 2**20, 530, 340, 52),
+    ("mip", False): (14 * 2**20, 350, 280, 11),
+    ("mip", True): (16 * 2**20, 360, 150, 67),
+}
+_SOLVER_MEMORY = {
+    "gurobi": (25 * 2**20, 1350, 770, 125),
+    "mip": (18 * 2**20, 1350, 770, 125),
+}
+
+
+def estimate_memory(size, solver="gurobi", matrix_api=False):
+    # Estimates in bytes for a model of the given size, see model_size, built vertex by
+    # vertex or, with matrix_api=True, through build_sparse_model. They are rough, within
+    # about 30% for large models in the measurements behind _PYTHON_MEMORY.
+    if solver not in ["gurobi", "mip"]:
+        raise ValueError('The options for solver are "gurobi" or "mip"')
+    counts = (
+        1,
+        size["variables"],
+        size["rows"] + size["indicators"],
+        size["nonzeros"] + size["indicator_nonzeros"],
+    )
+    python = sum(c * n for c, n in zip(_PYTHON_MEMORY[solver, bool(matrix_api)], counts))
+    solver_side = sum(c * n for c, n in zip(_SOLVER_MEMORY[solver], counts))
+    return {"python": int(python), "solver": int(solver_side), "total": int(python + solver_side)}
+
+
+def to_gurobi(sm, m):
+
+    import gurobipy as gp
+
+    x = m.addMVar(sm.num_vars, vtype=gp.GRB.BINARY)
+    m.setObjective(sm.obj @ x, gp.GRB.MAXIMIZE)
+    m.addMConstr(sm.A, x, sm.sense, sm.rhs)
+    for var, val, M, sense, rhs in sm.indicators:
+        m.addGenConstrIndicator(x[var], val, M @ x, sense, rhs)
+
+    return dict(zip(sm.nodes, x[sm.block("red")].tolist()))
+
+
+def to_mip(sm, m):
+
+    import mip
+
+    if sm.indicators:
+        raise ValueError('The formulation "indicator" is not available for python-mip')
+
+    x = [m.add_var(var_type=mip.BINARY) for _ in range(sm.num_vars)]
+    m.objective = mip.LinExpr([x[j] for j in np.flatnonzero(sm.obj)], sm.obj[sm.obj != 0].tolist())
+
+    # python-mip has no matrix interface, so the rows are added one at a time from the
+    # CSR arrays.
+    A = sm.A
+    for r in range(sm.num_rows):
+        cols = A.indices[A.indptr[r] : A.indptr[r + 1]]
+        vals = A.data[A.indptr[r] : A.indptr[r + 1]]
+        m.add_constr(
+            mip.LinExpr([x[j] for j in cols], vals.tolist(), -float(sm.rhs[r]), sm.sense[r])
+        )
+
+    return dict(zip(sm.nodes, x[sm.block("red")]))
+
+
+if __name__ == "__main__":
+    import networkx as nx
+
+    # model_size against the models built by build_sparse_model, for degree sequences with
+    # isolated vertices, odd degrees and high even degrees.
+    sequences = [
+        [0, 0, 0],
+        [0, 1, 1],
+        [2, 2, 2, 2, 0, 1, 1],
+        [4, 4, 4, 4, 4, 2, 2, 0, 3, 3],
+        [6, 5, 4, 4, 3, 3, 2, 2, 1, 0],
+    ]
+    for deg in sequences:
+        G = nx.havel_hakimi_graph(deg)
+        for formulation in ["standard", "bosch", "bosch_subsets", "alternative", "indicator"]:
+            for drop_optional, lazy in [(False, False), (True, False), (False, True)]:
+                size = model_size(deg, formulation, drop_optional, lazy)
+                sm = build_sparse_model(G, formulation, drop_optional, lazy)
+                built = {
+                    "variables": sm.num_vars,
+                    "rows": sm.num_rows,
+                    "nonzeros": sm.A.nnz,
+                    "indicators": sum(len(ind[0]) for ind in sm.indicators),
+                    "indicator_nonzeros": sum(ind[2].nnz for ind in sm.indicators),
+                }
+                assert size == built, (deg, formulation, drop_optional, lazy, size, built)
+    print("model_size agrees with build_sparse_model")
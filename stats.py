@@ -0,0 +1,149 @@
+import json
+import math
+import sys
+
+
+class SolveStats:
+    # Statistics of one call of kl_gurobi or kl_mip, filled in if passed as stats. The
+    # phases are (name, start, end) triples in seconds since the call: "build" for the
+    # construction of the model in Python, followed by "presolve", "root" and "branch" for
+    # Gurobi, told apart in the callback, and by a single "solve" for python-mip. The peak
+    # RSS is that of the whole process up to the end of the solve, in bytes, and includes
+    # the memory of the solver since both run in the same process.
+    def __init__(self, label=None):
+        self.label = label
+        self.solver = None
+        self.formulation = None
+        self.started = None
+        self.build_time = None
+        self.solve_time = None
+        self.variables = None
+        self.rows = None
+        self.nonzeros = None
+        self.indicators = None
+        self.nodes = None
+        self.value = None
+        self.bound = None
+        self.gap = None
+        self.status = None
+        self.peak_rss = None
+        self.phases = []
+        self._marks = []
+
+    def mark(self, phase, runtime):
+        # Called by the solver callback with the time since the start of the solve. Only
+        # the first occurrence of each phase counts, so the phases never go back.
+        if phase is not None and all(phase != name for name, _ in self._marks):
+            self._marks.append((phase, runtime))
+
+    def record(
+        self,
+        solver,
+        formulation,
+        started,
+        build_time,
+        solve_time,
+        size,
+        nodes,
+        value,
+        bound,
+        gap,
+        status,
+    ):
+        self.solver = solver
+        self.formulation = formulation
+        self.started = started
+        self.build_time = build_time
+        self.solve_time = solve_time
+        self.variables = size["variables"]
+        self.rows = size["rows"]
+        self.nonzeros = size["nonzeros"]
+        self.indicators = size["indicators"]
+        self.nodes = nodes
+        self.value = value
+        self.bound = bound
+        self.gap = gap
+        self.status = status
+        self.peak_rss = _peak_rss()
+
+        marks = self._marks or [("solve", 0.0)]
+        ends = [runtime for _, runtime in marks[1:]] + [solve_time]
+        self.phases = [("build", 0.0, build_time)]
+        for k, ((name, _), end) in enumerate(zip(marks, ends)):
+            # The solver starts in the first phase, before its first callback.
+            start = 0.0 if k == 0 else marks[k][1]
+            self.phases.append((name, build_time + start, build_time + end))
+
+    def to_dict(self):
+        result = {key: value for key, value in vars(self).items() if not key.startswith("_")}
+        result["phases"] = [
+            {"name": name, "start": start, "end": end} for name, start, end in self.phases
+        ]
+        return result
+
+
+def write_trace(stats, path, format="chrome"):
+    # Writes a list of SolveStats to a file. With format="json", it is the list of their
+    # dicts, and with format="chrome", the Trace Event Format of chrome://tracing and
+    # Perfetto: one row per call, placed at its wall clock time, with the call spanning its
+    # phases and all statistics as arguments. Calls that never reached the solver are left
+    # out of the trace.
+    if format not in ["chrome", "json"]:
+        raise ValueError('The options for format are "chrome" or "json"')
+    if format == "json":
+        data = [_finite(s.to_dict()) for s in stats]
+    else:
+        stats = [s for s in stats if s.started is not None]
+        origin = min((s.started for s in stats), default=0.0)
+        events = []
+        for tid, s in enumerate(stats):
+            offset = s.started - origin
+            args = _finite(s.to_dict())
+            del args["phases"], args["label"]
+            name = str(s.label) if s.label is not None else f"{s.solver} {s.formulation}"
+            spans = [(name, 0.0, s.phases[-1][2], args)]
+            spans += [(phase, start, end, {}) for phase, start, end in s.phases]
+            for phase, start, end, phase_args in spans:
+                events.append(
+                    {
+                        "name": phase,
+                        "ph": "X",
+                        "pid": 0,
+                        "tid": tid,
+                        "ts": 1e6 * (offset + start),
+                        "dur": 1e6 * (end - start),
+                        "args": phase_args,
+                    }
+                )
+            events.append(
+                {"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": name}}
+            )
+        data = {"traceEvents": events, "displayTimeUnit": "ms"}
+    with open(path, "w") as f:
+        json.dump(data, f, default=_json_default)
+
+
+def _finite(values):
+    # A missing bound and the corresponding gap are infinite, which is not valid JSON.
+    return {
+        key: str(value) if isinstance(value, float) and not math.isfinite(value) else value
+        for key, value in values.items()
+    }
+
+
+def _json_default(value):
+    # Numpy scalars, for example the labels of graphs with integer vertices.
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _peak_rss():
+    # The resource module is not available on Windows. ru_maxrss is in kilobytes on Linux
+    # and in bytes on macOS.
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else 1024 * rss
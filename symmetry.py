@@ -0,0 +1,99 @@
+from networkx.algorithms.isomorphism import GraphMatcher
+import itertools as it
+
+from csr_graph import as_networkx
+
+
+def grid_automorphisms(m, n, periodic=False):
+    # Automorphisms of nx.grid_2d_graph(m, n, periodic): reflections of both axes, the
+    # transposition for square grids and the translations along periodic axes. As for
+    # nx.grid_2d_graph, periodic is a bool for both axes or a pair of bools, one per axis,
+    # and square grids with only one periodic axis are not transposed.
+    if hasattr(periodic, "__iter__"):
+        periodic = [bool(p) for p in periodic]
+        if len(periodic) != 2:
+            raise ValueError("periodic must be a bool or a pair of bools, one for each axis")
+        periodic_i, periodic_j = periodic
+    else:
+        periodic_i = periodic_j = bool(periodic)
+    maps = []
+    shifts = it.product(range(m) if periodic_i else [0], range(n) if periodic_j else [0])
+    for di, dj in shifts:
+        for flip_i, flip_j, transpose in it.product([False, True], repeat=3):
+            if transpose and (m != n or periodic_i != periodic_j):
+                continue
+
+            def image(v):
+                i, j = v
+                if transpose:
+                    i, j = j, i
+                if flip_i:
+                    i = (-i if periodic_i else m - 1 - i) % m
+                if flip_j:
+                    j = (-j if periodic_j else n - 1 - j) % n
+                return ((i + di) % m, (j + dj) % n)
+
+            maps.append({v: image(v) for v in it.product(range(m), range(n))})
+    unique = {tuple(sigma.values()): sigma for sigma in maps}
+    return [sigma for sigma in unique.values() if any(v != w for v, w in sigma.items())]
+
+
+def triangle_automorphisms(n):
+    # Vertices (i, j) with 0 <= j <= i <= n, as in plotting.triangle_to_eps, have the
+    # barycentric coordinates (j, i - j, n - i), and the six permutations of these
+    # coordinates are the rotations and reflections of the triangle.
+    vertices = [(i, j) for i in range(n + 1) for j in range(i + 1)]
+    maps = []
+    for perm in it.permutations(range(3)):
+        if perm == (0, 1, 2):
+            continue
+        sigma = {}
+        for i, j in vertices:
+            coords = (j, i - j, n - i)
+            a, b, c = (coords[p] for p in perm)
+            sigma[(i, j)] = (n - c, a)
+        maps.append(sigma)
+    return maps
+
+
+def automorphism_group(G, max_size=None):
+    G = as_networkx(G)
+    maps = []
+    for sigma in GraphMatcher(G, G).isomorphisms_iter():
+        if all(v == w for v, w in sigma.items()):
+            continue
+        maps.append(sigma)
+        if max_size is not None and len(maps) >= max_size:
+            break
+    return maps
+
+
+def symmetry_breaking_pairs(nodes, automorphisms, red_vertices=None, blue_vertices=None):
+    # Restricting to solutions that are lexicographically maximal in their orbit, with the
+    # vertices ordered as in nodes, gives red[v] >= red[sigma(v)] for every automorphism
+    # sigma and the first vertex v in the order that sigma moves. Only automorphisms that
+    # map the fixed red and blue vertices onto themselves are used.
+    red_vertices = set(red_vertices or [])
+    blue_vertices = set(blue_vertices or [])
+    pairs = []
+    for sigma in automorphisms:
+        if any(sigma[v] not in red_vertices for v in red_vertices):
+            continue
+        if any(sigma[v] not in blue_vertices for v in blue_vertices):
+            continue
+        for v in nodes:
+            if sigma[v] != v:
+                pairs.append((v, sigma[v]))
+                break
+    return list(dict.fromkeys(pairs))
+
+
+def canonical_coloring(red_vertices, automorphisms, index):
+    # The image of the red vertices under the automorphisms, identity included, whose
+    # sorted positions in index, a dict from vertices to integers, are lexicographically
+    # smallest. Colorings in the same orbit have the same canonical coloring.
+    images = [red_vertices] + [[sigma[x] for x in red_vertices] for sigma in automorphisms]
+    return min(
+        (sorted(image, key=index.__getitem__) for image in images),
+        key=lambda image: [index[x] for x in image],
+    )
@@ -0,0 +1,255 @@
+import numpy as np
+from fractions import Fraction
+from functools import lru_cache
+
+
+def kl_grid_transfer(m, n, periodic=False):
+    # Computes kl(nx.grid_2d_graph(m, n, periodic)) column by column. The state after
+    # column j is the pair of colorings (column j - 1, column j), encoded as bitmasks with
+    # bit i for the vertex (i, j). Column j - 1 is checked when column j + 1 is appended,
+    # since then all its neighbors are known. The cost is linear in n and the state
+    # space has 4^m elements, so m should be small.
+    if isinstance(periodic, bool):
+        periodic = (periodic, periodic)
+    wrap_columns = periodic[0] and m > 2
+    wrap_rows = periodic[1] and n > 2
+
+    if not wrap_rows:
+        result = _solve_path(m, n, wrap_columns, None)
+    else:
+        result = None
+        for first in range(2**m):
+            for second in range(2**m):
+                candidate = _solve_path(m, n, wrap_columns, (first, second))
+                if candidate is not None and (result is None or candidate[0] > result[0]):
+                    result = candidate
+
+    if result is None:
+        return None, None, "infeasible"
+    value, columns = result
+    red_vertices = [(i, j) for j, b in enumerate(columns) for i in range(m) if b >> i & 1]
+    return value, red_vertices, "optimal"
+
+
+def _solve_path(m, n, wrap_columns, closing):
+    # Without closing, the columns form a path. With closing = (c0, c1), the first two
+    # columns are fixed and column n - 1 is also adjacent to column 0.
+    size = 2**m
+    vertical = _vertical_neighbors(m, wrap_columns)
+
+    if n == 1:
+        values = [
+            (bin(b).count("1"), [b]) for b in range(size) if _check(b, 0, False, False, vertical)
+        ]
+        return max(values, key=lambda value: value[0]) if values else None
+
+    tables = _transitions(m, wrap_columns)
+    V = _initial_values(m, vertical, closing)
+    parents = []
+    for _ in range(2, n):
+        V, parent = _step(V, tables)
+        parents.append(parent)
+    V = _final_values(V, m, vertical, closing)
+
+    state = int(np.argmax(V))
+    if V[state] == -np.inf:
+        return None
+    value = int(V[state])
+    columns = [state % size, state // size]
+    for parent in reversed(parents):
+        state = int(parent[state])
+        columns.append(state // size)
+    return value, columns[::-1]
+
+
+def _initial_values(m, vertical, closing):
+    size = 2**m
+    V = np.full(size * size, -np.inf)
+    if closing is None:
+        for b in range(size):
+            for c in _right_neighbors(b, 0, False, vertical):
+                V[b * size + c] = bin(b).count("1") + bin(c).count("1")
+    else:
+        c0, c1 = closing
+        V[c0 * size + c1] = bin(c0).count("1") + bin(c1).count("1")
+    return V
+
+
+def _step(V, tables):
+    src, dst, gain, starts, targets, counts, segment = tables
+    vals = V[src] + gain
+    best = np.maximum.reduceat(vals, starts)
+    first = np.flatnonzero(vals == np.repeat(best, counts))
+    first = first[np.unique(segment[first], return_index=True)[1]]
+    parent = np.full(len(V), -1, dtype=np.int64)
+    parent[targets] = src[first]
+    V = np.full(len(V), -np.inf)
+    V[targets] = best
+    return V, parent
+
+
+def _final_values(V, m, vertical, closing):
+    size = 2**m
+    if closing is None:
+        return np.where(_final_mask(m, tuple(map(tuple, vertical))), V, -np.inf)
+    V = V.copy()
+    c0, c1 = closing
+    for state in np.flatnonzero(V > -np.inf).tolist():
+        a, b = divmod(state, size)
+        if not (
+            _check(b, a, True, True, vertical, c0) and _check(c0, b, True, True, vertical, c1)
+        ):
+            V[state] = -np.inf
+    return V
+
+
+@lru_cache(maxsize=None)
+def _final_mask(m, vertical):
+    size = 2**m
+    return np.array(
+        [_check(state % size, state // size, True, False, vertical) for state in range(size**2)]
+    )
+
+
+def _vertical_neighbors(m, wrap_columns):
+    if wrap_columns:
+        return [[(i - 1) % m, (i + 1) % m] for i in range(m)]
+    return [[k for k in (i - 1, i + 1) if 0 <= k < m] for i in range(m)]
+
+
+def _check(b, a, has_left, has_right, vertical, c=0):
+    for i, neighbors in enumerate(vertical):
+        count = sum(b >> k & 1 for k in neighbors) + has_left * (a >> i & 1)
+        count += has_right * (c >> i & 1)
+        degree = len(neighbors) + has_left + has_right
+        if (2 * count == degree) != bool(b >> i & 1):
+            return False
+    return True
+
+
+def _right_neighbors(b, a, has_left, vertical):
+    # All columns c to the right of column b (with left neighbor column a) such that every
+    # vertex of b is valid. Each vertex allows one or two colors of its right neighbor.
+    columns = [0]
+    for i, neighbors in enumerate(vertical):
+        count = sum(b >> k & 1 for k in neighbors) + has_left * (a >> i & 1)
+        degree = len(neighbors) + has_left + 1
+        colors = [r for r in (0, 1) if (2 * (count + r) == degree) == bool(b >> i & 1)]
+        columns = [c | r << i for c in columns for r in colors]
+    return columns
+
+
+@lru_cache(maxsize=None)
+def _transitions(m, wrap_columns):
+    # Transitions from state (a, b) to (b, c) of the interior columns, sorted by target
+    # state for np.maximum.reduceat, together with the start index of every target.
+    size = 2**m
+    vertical = _vertical_neighbors(m, wrap_columns)
+    src, dst, gain = [], [], []
+    for a in range(size):
+        for b in range(size):
+            for c in _right_neighbors(b, a, True, vertical):
+                src.append(a * size + b)
+                dst.append(b * size + c)
+                gain.append(bin(c).count("1"))
+    src, dst, gain = np.array(src), np.array(dst), np.array(gain, dtype=float)
+    order = np.argsort(dst, kind="stable")
+    src, dst, gain = src[order], dst[order], gain[order]
+    targets, starts = np.unique(dst, return_index=True)
+    counts = np.diff(np.append(starts, len(src)))
+    segment = np.repeat(np.arange(len(starts)), counts)
+    return src, dst, gain, starts, targets, counts, segment
+
+
+class GridSequence:
+    # kl(m x n) for all n, given by the values up to start + period - 1 and a certificate
+    # that kl(n + period) = kl(n) + increment for all n >= start, see _certify_period.
+    def __init__(self, m, periodic, values, start, period, increment):
+        self.m = m
+        self.periodic = periodic
+        self.values = values
+        self.start = start
+        self.period = period
+        self.increment = increment
+
+    def __call__(self, n):
+        if n < self.start + self.period:
+            return self.values[n]
+        k, r = divmod(n - self.start, self.period)
+        return self.values[self.start + r] + k * self.increment
+
+    @property
+    def certificate(self):
+        return {"start": self.start, "period": self.period, "increment": self.increment}
+
+    @property
+    def slope(self):
+        return Fraction(self.increment, self.period)
+
+    def closed_form(self):
+        # Returns (a, b) with kl(m x n) = a * n + b[n % period] for all n >= start.
+        b = {}
+        for n in range(self.start, self.start + self.period):
+            b[n % self.period] = self.values[n] - self.slope * n
+        return self.slope, b
+
+
+def kl_grid_sequence(m, periodic=False, max_n=10000, window=None):
+    # Candidates for the period are found by hashing the state values within window of
+    # the best state, relative to it, and every candidate is then certified exactly.
+    if isinstance(periodic, bool):
+        periodic = (periodic, periodic)
+    if periodic[1]:
+        raise ValueError("Sequences are only available for grids that are not periodic in n")
+    if window is None:
+        window = 4 * m
+    wrap_columns = periodic[0] and m > 2
+    vertical = _vertical_neighbors(m, wrap_columns)
+    tables = _transitions(m, wrap_columns)
+
+    def final(V):
+        value = _final_values(V, m, vertical, None).max()
+        return int(value) if value > -np.inf else None
+
+    values = {1: kl_grid_transfer(m, 1, periodic)[0]}
+    history = {}
+    seen = {}
+    V = _initial_values(m, vertical, None)
+    for n in range(2, max_n + 1):
+        values[n] = final(V)
+        history[n] = V
+        finite = V > -np.inf
+        top = V[finite].max() if finite.any() else 0
+        near = V >= top - window
+        key = near.tobytes() + (V[near] - top).tobytes()
+        if key in seen:
+            start = seen[key]
+            increment = top - history[start][history[start] > -np.inf].max()
+            if _certify_period(history[start], V, increment, values, start, tables, final):
+                del values[n]
+                return GridSequence(m, periodic, values, start, n - start, int(increment))
+        seen[key] = n
+        V, _ = _step(V, tables)
+    # This also happens if kl(m x n) grows at different rates for different residues of n,
+    # as for paths (m = 1), where the blue coloring is the only valid one for most n.
+    raise RuntimeError(f"No period of kl(m x n) with one increment was found for n <= {max_n}")
+
+
+def _certify_period(A, B, increment, values, start, tables, final):
+    # A and B are the state values after start and start + p columns. If
+    #   (1) B <= A + increment for all states,
+    #   (2) starting from A restricted to the states S where equality holds, the values
+    #       after p more columns are again at least B on S, and
+    #   (3) the restricted start already gives kl(start + k) for 0 <= k < p,
+    # then kl(n + p) = kl(n) + increment for all n >= start: By (1) and monotonicity of
+    # the transfer operator, kl(n + p) <= kl(n) + increment, by (2) the restricted values
+    # grow by at least increment every p columns, and by (3) both bounds coincide.
+    if not np.all(B <= A + increment):
+        return False
+    S = (B > -np.inf) & (B == A + increment)
+    X = np.where(S, A, -np.inf)
+    for k in range(len(values) - start):
+        if final(X) != values[start + k]:
+            return False
+        X, _ = _step(X, tables)
+    return bool(np.all(X[S] >= B[S]))
@@ -0,0 +1,206 @@
+import networkx as nx
+from networkx.algorithms.approximation import treewidth_min_fill_in
+
+from branch_and_bound import kl_branch_and_bound
+from knights_and_liars import kl_gurobi, kl_mip
+from csr_graph import as_networkx
+from decompose import _TIME_LIMIT
+from utility import trivially_blue_vertices
+
+
+def kl_solve(
+    G,
+    red_vertices=None,
+    blue_vertices=None,
+    solver="gurobi",
+    max_width=10,
+    time_limit=None,
+    **kwargs,
+):
+    # Uses the dynamic program of kl_treewidth if the min-fill heuristic finds a tree
+    # decomposition of width at most max_width, and the given solver otherwise. The
+    # time_limit is passed to the solver in its own keyword.
+    if solver not in ["gurobi", "mip", "native"]:
+        raise ValueError('The options for solver are "gurobi", "mip" or "native"')
+
+    G = as_networkx(G)
+    decomposition = treewidth_min_fill_in(_reduced_graph(G))
+    if decomposition[0] <= max_width:
+        return kl_treewidth(G, red_vertices, blue_vertices, decomposition)
+    if time_limit is not None:
+        kwargs[_TIME_LIMIT[solver]] = time_limit
+    solve = {"gurobi": kl_gurobi, "mip": kl_mip, "native": kl_branch_and_bound}[solver]
+    return solve(G, red_vertices=red_vertices, blue_vertices=blue_vertices, **kwargs)
+
+
+def _reduced_graph(G):
+    # The trivially blue vertices are blue in every coloring and their own condition always
+    # holds, so they can be removed, as long as the degrees are taken from G.
+    tvb_vertices = trivially_blue_vertices(G)
+    return G.subgraph([x for x in G.nodes() if x not in tvb_vertices])
+
+
+def nice_tree_decomposition(G, decomposition=None):
+    # Turns a tree decomposition (width, T) as returned by treewidth_min_fill_in into a nice
+    # one. Its nodes (kind, bag, vertex, children) are of the kinds "leaf", "introduce",
+    # "forget" and "join", every node comes after its children and the root, the last
+    # node, has an empty bag. Bags are tuples in the order of G.nodes().
+    if decomposition is None:
+        decomposition = treewidth_min_fill_in(G)
+    width, T = decomposition
+    index = {x: i for i, x in enumerate(G.nodes())}
+    nodes = []
+
+    def add(kind, bag, vertex, children):
+        nodes.append((kind, tuple(sorted(bag, key=index.__getitem__)), vertex, children))
+        return len(nodes) - 1
+
+    def move(node, target):
+        bag = set(nodes[node][1])
+        for x in sorted(bag - target, key=index.__getitem__):
+            bag.remove(x)
+            node = add("forget", bag, x, [node])
+        for x in sorted(target - bag, key=index.__getitem__):
+            bag.add(x)
+            node = add("introduce", bag, x, [node])
+        return node
+
+    if T.number_of_nodes() == 0:
+        add("leaf", [], None, [])
+        return width, nodes
+
+    root = next(iter(T.nodes()))
+    result = {}
+    for t in nx.dfs_postorder_nodes(T, root):
+        children = [move(result[c], t) for c in T.neighbors(t) if c in result]
+        if not children:
+            node = move(add("leaf", [], None, []), t)
+        else:
+            node = children[0]
+            for child in children[1:]:
+                node = add("join", t, None, [node, child])
+        result[t] = node
+    move(result[root], set())
+    return width, nodes
+
+
+def kl_treewidth(G, red_vertices=None, blue_vertices=None, decomposition=None):
+    # Dynamic program over a nice tree decomposition of G without its trivially blue
+    # vertices. A state stores, for each vertex of the bag, its color and its number of red
+    # neighbors among the vertices forgotten so far, encoded as 2 * count + red. A vertex is
+    # checked when it is forgotten, since then its other neighbors are all in the bag. The
+    # table of a node keeps the best value for each state, together with the state(s) of
+    # the child(ren) it came from.
+    G = as_networkx(G)
+    red_vertices = set(red_vertices or [])
+    blue_vertices = set(blue_vertices or [])
+    if any(x not in G for x in red_vertices):
+        return None, None, "infeasible"
+    H = _reduced_graph(G)
+    if any(x not in H or x in blue_vertices for x in red_vertices):
+        return None, None, "infeasible"
+
+    width, nodes = nice_tree_decomposition(H, decomposition)
+    half = {x: G.degree[x] // 2 for x in H.nodes()}
+    degree = dict(H.degree())
+
+    tables = []
+    forgotten = []
+    for kind, bag, vertex, children in nodes:
+        if kind == "leaf":
+            table = {(): (0, None)}
+            counts = {}
+
+        elif kind == "introduce":
+            counts = dict(forgotten[children[0]])
+            counts[vertex] = 0
+            remaining = [degree[x] - counts[x] for x in bag]
+            p = bag.index(vertex)
+            if vertex in red_vertices:
+                colors = [1]
+            elif vertex in blue_vertices:
+                colors = [0]
+            else:
+                colors = [0, 1]
+            table = {}
+            for key, (value, _) in tables[children[0]].items():
+                for color in colors:
+                    state = _state(bag, key[:p] + (color,) + key[p:], half, remaining)
+                    if state is not None and (state not in table or table[state][0] < value):
+                        table[state] = (value, key)
+
+        elif kind == "forget":
+            counts = {x: c for x, c in forgotten[children[0]].items() if x != vertex}
+            for x in bag:
+                if H.has_edge(x, vertex):
+                    counts[x] += 1
+            remaining = [degree[x] - counts[x] for x in bag]
+            p = nodes[children[0]][1].index(vertex)
+            neighbors = [i for i, x in enumerate(bag) if H.has_edge(x, vertex)]
+            table = {}
+            for key, (value, _) in tables[children[0]].items():
+                s = key[p]
+                rest = key[:p] + key[p + 1 :]
+                if ((s >> 1) + sum(rest[i] & 1 for i in neighbors) == half[vertex]) != (s & 1):
+                    continue
+                if s & 1:
+                    rest = tuple(r + 2 if i in neighbors else r for i, r in enumerate(rest))
+                state = _state(bag, rest, half, remaining)
+                if state is not None and (state not in table or table[state][0] < value + (s & 1)):
+                    table[state] = (value + (s & 1), key)
+
+        else:
+            left, right = children
+            counts = {x: forgotten[left][x] + forgotten[right][x] for x in bag}
+            remaining = [degree[x] - counts[x] for x in bag]
+            matching = {}
+            for key, (value, _) in tables[right].items():
+                matching.setdefault(tuple(s & 1 for s in key), []).append((key, value))
+            table = {}
+            for lkey, (lvalue, _) in tables[left].items():
+                for rkey, rvalue in matching.get(tuple(s & 1 for s in lkey), []):
+                    key = tuple(a + (b & ~1) for a, b in zip(lkey, rkey))
+                    state = _state(bag, key, half, remaining)
+                    if state is not None and (
+                        state not in table or table[state][0] < lvalue + rvalue
+                    ):
+                        table[state] = (lvalue + rvalue, (lkey, rkey))
+
+        tables.append(table)
+        forgotten.append(counts)
+
+    if () not in tables[-1]:
+        return None, None, "infeasible"
+
+    red = []
+    stack = [(len(nodes) - 1, ())]
+    while stack:
+        node, key = stack.pop()
+        kind, bag, vertex, children = nodes[node]
+        if kind == "leaf":
+            continue
+        back = tables[node][key][1]
+        if kind == "join":
+            stack.extend(zip(children, back))
+            continue
+        if kind == "forget" and back[nodes[children[0]][1].index(vertex)] & 1:
+            red.append(vertex)
+        stack.append((children[0], back))
+    return tables[-1][()][0], red, "optimal"
+
+
+def _state(bag, key, half, remaining):
+    # Normalizes the counts of a state, or returns None if it cannot be completed. A red
+    # vertex needs exactly half of its neighbors red, and a blue vertex is satisfied for good
+    # once its count exceeds half of its degree or can no longer reach it. All such blue
+    # states are merged into the count half + 1, since they behave the same from then on.
+    state = []
+    for x, s, r in zip(bag, key, remaining):
+        c = s >> 1
+        if s & 1:
+            if c > half[x] or c + r < half[x]:
+                return None
+        elif c > half[x] or c + r < half[x]:
+            s = 2 * (half[x] + 1)
+        state.append(s)
+    return tuple(state)
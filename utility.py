@@ -27,13 +27,134 @@ def tvb_step(G, tvb_vertices):
 
 
 def trivially_blue_vertices(G):
-    tvb_vertices = set()
-    while True:
-        tvb_vertices_next = tvb_step(G, tvb_vertices)
-        if tvb_vertices_next == tvb_vertices:
-            return tvb_vertices
-        else:
-            tvb_vertices = tvb_vertices_next
+    if hasattr(G, "tocsr"):
+        import numpy as np
+
+        A = G.tocsr()
+        return set(np.flatnonzero(trivially_blue_mask(A.indptr, A.indices)).tolist())
+
+    if hasattr(G, "trivially_blue_mask"):
+        import numpy as np
+
+        return set(G.vertex(i) for i in np.flatnonzero(G.trivially_blue_mask()).tolist())
+
+    from csr_graph import CSRGraph
+
+    if isinstance(G, CSRGraph):
+        import numpy as np
+
+        nodes = G.nodes()
+        blue = trivially_blue_mask(G.indptr, G.indices)
+        return set(nodes[i] for i in np.flatnonzero(blue).tolist())
+
+    # Instead of repeating tvb_step until nothing changes, every vertex that turns blue
+    # increments the blue-neighbor counters of its neighbors once, so the work is O(V + E).
+    tvb_vertices = set([x for x in G.nodes() if G.degree[x] % 2 == 1])
+    blue_neighbors = dict.fromkeys(G.nodes(), 0)
+    queue = list(tvb_vertices)
+    while queue:
+        x = queue.pop()
+        for y in G.neighbors(x):
+            if y in tvb_vertices:
+                continue
+            blue_neighbors[y] += 1
+            if 2 * blue_neighbors[y] > G.degree[y]:
+                tvb_vertices.add(y)
+                queue.append(y)
+    return tvb_vertices
+
+
+def trivially_blue_mask(indptr, indices):
+    import numpy as np
+
+    indptr = np.asarray(indptr)
+    indices = np.asarray(indices)
+    deg = np.diff(indptr)
+    blue = deg % 2 == 1
+    blue_neighbors = np.zeros(len(deg), dtype=np.int64)
+    frontier = np.flatnonzero(blue)
+    while len(frontier) > 0:
+        starts = indptr[frontier]
+        lengths = deg[frontier]
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        neighbors = indices[offsets + np.arange(lengths.sum())]
+        neighbors = neighbors[~blue[neighbors]]
+        np.add.at(blue_neighbors, neighbors, 1)
+        touched = np.unique(neighbors)
+        frontier = touched[2 * blue_neighbors[touched] > deg[touched]]
+        blue[frontier] = True
+    return blue
+
+
+def repair_coloring(G, red_vertices):
+    # Turns an arbitrary red set into a valid coloring by only making vertices blue: a
+    # violated red vertex is made blue, and for a violated blue vertex one of its red
+    # neighbors is. Isolated vertices are always red.
+    red = set([x for x in red_vertices if x in G])
+    red |= set([x for x in G.nodes() if G.degree[x] == 0])
+    red_neighbors = {x: len([y for y in G.neighbors(x) if y in red]) for x in G.nodes()}
+
+    def violated(x):
+        return (2 * red_neighbors[x] == G.degree[x]) != (x in red)
+
+    queue = [x for x in G.nodes() if violated(x)]
+    while queue:
+        x = queue.pop()
+        if not violated(x):
+            continue
+        victim = x if x in red else next(y for y in G.neighbors(x) if y in red)
+        red.remove(victim)
+        queue.append(victim)
+        for y in G.neighbors(victim):
+            red_neighbors[y] -= 1
+            queue.append(y)
+    return red
+
+
+def grid_start(red_vertices, m, n, M, N, periodic=False, tile=False):
+    # Maps a coloring of the m x n grid into the M x N grid, either placed at every
+    # possible offset or, with tile=True, repeated periodically with every possible phase,
+    # and returns the largest of the repaired colorings.
+    import networkx as nx
+
+    G = nx.grid_2d_graph(M, N, periodic=periodic)
+    red_vertices = set(red_vertices)
+    if tile:
+        candidates = [
+            [
+                (i, j)
+                for i in range(M)
+                for j in range(N)
+                if ((i + a) % m, (j + b) % n) in red_vertices
+            ]
+            for a in range(m)
+            for b in range(n)
+        ]
+    else:
+        candidates = [
+            [(i + a, j + b) for i, j in red_vertices]
+            for a in range(max(M - m, 0) + 1)
+            for b in range(max(N - n, 0) + 1)
+        ]
+    return max((repair_coloring(G, red) for red in candidates), key=len)
+
+
+def triangle_graph(n):
+    # The triangular grid with side n drawn by plotting.triangle_to_eps: vertices (i, j)
+    # with 0 <= j <= i <= n, where row i has i + 1 vertices, adjacent to their neighbors
+    # in the same row and to two vertices in each of the neighboring rows.
+    import networkx as nx
+
+    G = nx.Graph()
+    G.add_nodes_from((i, j) for i in range(n + 1) for j in range(i + 1))
+    for i in range(n + 1):
+        for j in range(i + 1):
+            if j < i:
+                G.add_edge((i, j), (i, j + 1))
+            if i < n:
+                G.add_edge((i, j), (i + 1, j))
+                G.add_edge((i, j), (i + 1, j + 1))
+    return G
 
 
 if __name__ == "__main__":
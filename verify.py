@@ -0,0 +1,56 @@
+import numpy as np
+
+from csr_graph import adjacency_matrix
+
+
+class ColoringVerifier:
+    # Checks colorings of a fixed graph against the Knights and Liars condition. The
+    # adjacency matrix is built once, and the red neighbors of all vertices of a coloring,
+    # or of a batch of colorings given as the rows of a 0/1 matrix, are one product with it.
+    # The lattices of lattice.py count the red neighbors themselves, without an adjacency
+    # matrix or a list of their vertices.
+    def __init__(self, G):
+        self.lattice = G if hasattr(G, "red_neighbor_counts") else None
+        if self.lattice is not None:
+            self.deg = G.degree_array()
+            return
+        self.nodes, self.A = adjacency_matrix(G, dtype=np.int32)
+        self.index = {x: i for i, x in enumerate(self.nodes)}
+        self.deg = np.diff(self.A.indptr)
+
+    def vector(self, red_vertices):
+        x = np.zeros(len(self.deg), dtype=np.int32)
+        if self.lattice is not None:
+            x[[self.lattice.index(v) for v in red_vertices]] = 1
+        else:
+            x[[self.index[v] for v in red_vertices]] = 1
+        return x
+
+    def vertex(self, i):
+        return self.lattice.vertex(i) if self.lattice is not None else self.nodes[i]
+
+    def violations(self, X):
+        # Boolean array of the shape of X, which is true for the vertices whose condition
+        # fails. The columns of X are the vertices in the order of G.nodes().
+        X = np.asarray(X, dtype=np.int32)
+        if self.lattice is not None:
+            red_neighbors = self.lattice.red_neighbor_counts(X)
+        else:
+            red_neighbors = (self.A @ X.T).T
+        return (2 * red_neighbors == self.deg) != (X == 1)
+
+    def check(self, coloring):
+        # Returns the violating vertices and the number of red vertices. The coloring is a
+        # collection of red vertices, or a 0/1 array with one coloring per row, in which
+        # case a list of violating vertices and an array of values per row are returned.
+        if not isinstance(coloring, np.ndarray):
+            coloring = self.vector(coloring)
+        violated = self.violations(coloring)
+        if coloring.ndim == 1:
+            return [self.vertex(i) for i in np.flatnonzero(violated)], int(coloring.sum())
+        violated_vertices = [[self.vertex(i) for i in np.flatnonzero(row)] for row in violated]
+        return violated_vertices, coloring.sum(axis=1)
+
+
+def verify_coloring(G, red_vertices):
+    return ColoringVerifier(G).check(red_vertices)